@@ -0,0 +1,215 @@
+# Airport table
+#  The full airport table (see airports.load_airports) as numpy arrays, with
+# a hash index on the IATA/ICAO codes and a 1° grid index on position.
+import csv
+import math
+import os
+import numpy as np
+
+######################################################################
+
+def first_column(row, names):
+
+	# OurAirports has renamed a few columns over the years
+	for name in names:
+		if (row.get(name)):
+			return row[name]
+
+	return ""
+
+######################################################################
+
+class AirportTable:
+
+	# Every airport as a set of numpy arrays (one element per airport), with
+	# a hash index on the IATA/ICAO codes and a 1° grid index on position
+
+	def __init__(self, iata, icao, name, lat, lon):
+
+		self.iata = iata
+		self.icao = icao
+		self.name = name
+		self.lat = lat
+		self.lon = lon
+
+		# Exact code lookups
+		self.codes = {}
+		for (idx, code) in enumerate(icao.tolist()):
+			if (code):
+				self.codes[code] = idx
+
+		for (idx, code) in enumerate(iata.tolist()):
+			if (code):
+				self.codes[code] = idx
+
+		# Prefix lookups are a binary search over the sorted codes
+		self.sorted_codes = np.array(sorted(self.codes))
+
+		# Sort the airports by 1° cell, so every cell (and every run of cells
+		# along a line of latitude) is a contiguous slice of self.order
+		self.cell = self.cell_of(lat, lon)
+		self.order = np.argsort(self.cell, kind="stable")
+		self.cell_starts = np.searchsorted(self.cell[self.order], np.arange(180 * 360 + 1))
+
+	def __len__(self):
+
+		return len(self.lat)
+
+	@staticmethod
+	def cell_of(lat, lon):
+
+		lat_idx = np.clip(np.floor(lat).astype(int) + 90, 0, 179)
+		lon_idx = np.floor(lon).astype(int) % 360
+
+		return lat_idx * 360 + lon_idx
+
+	def airport(self, idx):
+
+		return {
+			"iata": str(self.iata[idx]),
+			"icao": str(self.icao[idx]),
+			"name": str(self.name[idx]),
+			"lat": float(self.lat[idx]),
+			"lon": float(self.lon[idx])
+		}
+
+	def lookup(self, code):
+
+		# IATA or ICAO code, e.g. SYD or YSSY
+		idx = self.codes.get(code.upper())
+
+		if (idx is None):
+			return None
+
+		return self.airport(idx)
+
+	def prefix(self, prefix):
+
+		# Every airport with an IATA or ICAO code starting with prefix
+		prefix = prefix.upper()
+		first = np.searchsorted(self.sorted_codes, prefix, side="left")
+		last = np.searchsorted(self.sorted_codes, prefix + "\uffff", side="left")
+
+		idxs = dict.fromkeys(self.codes[code] for code in self.sorted_codes[first:last].tolist())
+
+		return [self.airport(idx) for idx in idxs]
+
+	def candidates(self, lat, lon, radius):
+
+		# Indices of every airport within a lat/lon box that contains
+		# everything up to "radius" degrees (great circle) from lat/lon
+		min_row = max(math.floor(lat - radius) + 90, 0)
+		max_row = min(math.floor(lat + radius) + 90, 179)
+
+		# Lines of longitude get closer together towards the poles
+		max_lat = min(abs(lat) + radius, 90)
+		if (max_lat >= 89):
+			half_width = 180
+		else:
+			half_width = min(math.ceil(radius / math.cos(math.radians(max_lat))) + 1, 180)
+
+		if (half_width >= 180):
+			spans = [(0, 359)]
+		else:
+			first = math.floor(lon) - half_width
+			last = math.floor(lon) + half_width
+			if (first < 0):
+				spans = [(first + 360, 359), (0, last)]
+			elif (last > 359):
+				spans = [(first, 359), (0, last - 360)]
+			else:
+				spans = [(first, last)]
+
+		slices = []
+		for row in range(min_row, max_row + 1):
+			for (first, last) in spans:
+				start = self.cell_starts[row * 360 + first]
+				end = self.cell_starts[row * 360 + last + 1]
+				if (end > start):
+					slices.append(self.order[start:end])
+
+		if (not slices):
+			return np.empty(0, dtype=int)
+
+		return np.concatenate(slices)
+
+	def nearest(self, lat, lon):
+
+		# The closest airport to lat/lon. Search a small box first, and only
+		# widen it if there's nothing close enough to be sure
+		radius = 1.0
+
+		while (True):
+			idxs = self.candidates(lat, lon, radius)
+
+			if (len(idxs)):
+				dist = angular_distance(lat, lon, self.lat[idxs], self.lon[idxs])
+				best = int(np.argmin(dist))
+
+				if (dist[best] <= radius or radius >= 180):
+					return self.airport(int(idxs[best]))
+
+			elif (radius >= 180):
+				return None
+
+			radius *= 2
+
+######################################################################
+
+def angular_distance(lat1, lon1, lat2, lon2):
+
+	# Great circle distance in degrees (haversine)
+	lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+
+	a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+
+	return np.degrees(2 * np.arcsin(np.sqrt(np.minimum(a, 1))))
+
+######################################################################
+
+def parse_airports_csv(filename):
+
+	iata = []
+	icao = []
+	name = []
+	lat = []
+	lon = []
+
+	with open(filename, newline="", encoding="utf-8") as fp:
+		for row in csv.DictReader(fp):
+			try:
+				this_lat = float(first_column(row, ["latitude_deg", "latitude", "lat"]))
+				this_lon = float(first_column(row, ["longitude_deg", "longitude", "lon"]))
+			except ValueError:
+				continue
+
+			iata.append(first_column(row, ["iata_code", "iata"]).upper())
+			icao.append(first_column(row, ["icao_code", "icao", "gps_code", "ident"]).upper())
+			name.append(row.get("name", ""))
+			lat.append(this_lat)
+			lon.append(this_lon)
+
+	return {
+		"iata": np.array(iata, dtype=str),
+		"icao": np.array(icao, dtype=str),
+		"name": np.array(name, dtype=str),
+		"lat": np.array(lat, dtype=np.float64),
+		"lon": np.array(lon, dtype=np.float64)
+	}
+
+######################################################################
+
+def load_table(filename):
+
+	# Parsing the CSV is slow, so the parsed arrays are cached next to it and
+	# reused until the CSV changes
+	cache = os.path.splitext(filename)[0] + ".npz"
+
+	if (os.path.isfile(cache) and os.path.getmtime(cache) >= os.path.getmtime(filename)):
+		with np.load(cache) as arrays:
+			columns = {key: arrays[key] for key in arrays.files}
+	else:
+		columns = parse_airports_csv(filename)
+		np.savez(cache, **columns)
+
+	return AirportTable(**columns)
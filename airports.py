@@ -1,3 +1,5 @@
+import functools
+import os
 
 airports = {
 	'auckland': (-37.008937, 174.786381),
@@ -8,3 +10,50 @@ airports = {
 	'saopaulo': (-23.430218, -46.471671),
 	'sydney': (-33.950031, 151.181694)
 }
+
+# The full airport table, in the OurAirports airports.csv format
+# (https://ourairports.com/data/)
+AIRPORTS_CSV = "data/airports.csv"
+
+######################################################################
+
+@functools.lru_cache(maxsize=None)
+def load_airports(filename=AIRPORTS_CSV):
+
+	# Returns the airport_table.AirportTable for the CSV, or None if we don't
+	# have one. Only pulls in numpy when there is a table to load
+	if (not os.path.isfile(filename)):
+		return None
+
+	import airport_table # type: ignore
+
+	return airport_table.load_table(filename)
+
+######################################################################
+
+def lookup(location):
+
+	# Coordinates for one of the named airports above, or an IATA/ICAO code
+	# from the full table
+	if location in airports:
+		return airports[location]
+
+	table = load_airports()
+
+	if (table):
+		airport = table.lookup(location)
+		if (airport):
+			return (airport["lat"], airport["lon"])
+
+	return None
+
+######################################################################
+
+def nearest_airport(lat, lon):
+
+	table = load_airports()
+
+	if (not table):
+		return None
+
+	return table.nearest(lat, lon)
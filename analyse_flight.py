@@ -3,49 +3,26 @@ import argparse
 import sys
 import math
 import time
-import pyproj # type: ignore
-import urllib
+import functools
+import urllib.error
 import datetime
 import grib_downloader # type: ignore
-import matplotlib as mpl # type: ignore
-
-# Command line arguments
-parser = argparse.ArgumentParser(
-            prog='KML Flight Analyser',
-            description='Takes a KML file from FilghtRadar24 and produces a *bEtTeR* KML file')
-
-parser.add_argument("kmlfile") # positional argument
-parser.add_argument("--out") # Write to a named KML file
-parser.add_argument("-s", "--speed", help="metres per second", default=250) # speed in m/s (250 m/s = 900 km/h = 559 mph)
-parser.add_argument("--level", type=int, choices=[300, 250, 200, 150, 50], default=250)
-parser.add_argument("--units", choices=['mph', 'kmh', 'mps'], default='mps')
-
-args = parser.parse_args()
+import airports # type: ignore
+import gradients # type: ignore
+import profiling # type: ignore
 
 # KML Namespace
 kml_ns = {'kml' : 'http://www.opengis.net/kml/2.2'}
 
-# Initialise the colour map
-cmap = mpl.colors.LinearSegmentedColormap.from_list("cmap", [
-		"#FF3F3F", # Red
-		"#FFCF00", # Orange
-		"#FFFFFF", #  White
-		"#003FFF", # Blue
-		"#3FFF3F" # Green
-	])
-
-# Create a geoid
-geod = pyproj.Geod(ellps='WGS84')
-
 ######################################################################
 
-def rgba_to_GE_hex(rgba):
+@functools.lru_cache(maxsize=None)
+def get_geod():
 
-	r = min(int(rgba[0] * 256), 255)
-	g = min(int(rgba[1] * 256), 255)
-	b = min(int(rgba[2] * 256), 255)
+	# Create a geoid. pyproj is slow to import, so wait until we need it
+	import pyproj # type: ignore
 
-	return f"FF{b:02x}{g:02x}{r:02x}"
+	return pyproj.Geod(ellps='WGS84')
 
 ######################################################################
 
@@ -104,8 +81,7 @@ def create_placemark(lat, lon, altitude, wind_impact, heading, name, description
 	# Cap the magnitude at some value
 	cap = 50
 	cmap_idx = (max(min(wind_impact, cap), -cap) + cap) / (2 * cap)
-	rgba = cmap(cmap_idx)
-	ge_color = rgba_to_GE_hex(rgba)
+	ge_color = gradients.ge_colour(gradients.WIND_IMPACT, cmap_idx)
 
 	return f"""
 	<Placemark>
@@ -222,7 +198,51 @@ def get_timestamps_from_route(route):
 	
 ######################################################################
 
-def parse_trail(trail, ds, fp):
+def get_times_from_route(route):
+
+	# When the plane was at each position, keyed by (lon, lat), so the trail
+	# segments can be given a time
+	times = {}
+
+	for pm in route.findall('kml:Placemark', kml_ns):
+		coords = pm.find("kml:Point/kml:coordinates", kml_ns)
+		(lon,lat,altitude) = [float(x) for x in coords.text.split(",")]
+
+		when = pm.find("kml:TimeStamp/kml:when", kml_ns)
+		times[(lon, lat)] = datetime.datetime.fromisoformat(when.text)
+
+	return times
+
+######################################################################
+
+def get_airports_from_route(route):
+
+	# The route starts and finishes on the ground, so the first and last
+	# PlaceMarks are at the airports. Returns their codes (if we have the
+	# full airport table)
+	placemarks = route.findall('kml:Placemark', kml_ns)
+	codes = []
+
+	for pm in (placemarks[0], placemarks[-1]):
+		coords = pm.find("kml:Point/kml:coordinates", kml_ns)
+		(lon,lat,altitude) = [float(x) for x in coords.text.split(",")]
+
+		airport = airports.nearest_airport(lat, lon)
+		if (not airport):
+			return None
+
+		codes.append(airport["iata"] or airport["icao"])
+
+	return tuple(codes)
+
+######################################################################
+
+def parse_trail(trail, ds, fp, speed=250, units="mps", rows=None, times=None, clock=None):
+
+	# If "rows" is a list, a tuple of the numbers for each segment is added to
+	# it (see flight_archive.COLUMNS). Segments are timed from "times" (see
+	# get_times_from_route()), or by adding up the predicted segment times
+	# from the last known one, starting at "clock"
 
 	# Start collecting all the points in the path
 	path = []
@@ -253,13 +273,15 @@ def parse_trail(trail, ds, fp):
 			continue
 
 		# What is the closest wind sample?
-		(magnitude, azimuth) = get_wind(start_point, ds)
+		with profiling.span("wind_lookup"):
+			(magnitude, azimuth) = get_wind(start_point, ds)
 
 		# lon/lat; lon/lat
-		(az12, az21, dist) = geod.inv(start_point[0], start_point[1], end_point[0], end_point[1])
+		with profiling.span("geodesic"):
+			(az12, az21, dist) = get_geod().inv(start_point[0], start_point[1], end_point[0], end_point[1])
 
 		head_tail = math.cos(math.radians(abs(azimuth - az12))) * magnitude
-		ground_speed = args.speed + head_tail
+		ground_speed = speed + head_tail
 		segment_time = dist / ground_speed
 
 		time_taken += segment_time
@@ -267,13 +289,21 @@ def parse_trail(trail, ds, fp):
 		if (az12 < 0):
 			az12 = az12 + 360
 
-		if (args.units == "mph"):
+		if (rows is not None):
+			clock = (times or {}).get((start_point[0], start_point[1]), clock)
+
+			rows.append((clock.timestamp(), start_point[1], start_point[0], start_point[2], magnitude, azimuth,
+				az12, head_tail, ground_speed, dist, segment_time))
+
+			clock += datetime.timedelta(seconds=segment_time)
+
+		if (units == "mph"):
 			name = f"{(head_tail * 2.23694):.2f} mph"
 			description = f"""
 			Wind: {(magnitude * 2.23694):.2f} mph at {azimuth:.0f}°
 			Plane: {(ground_speed * 2.23694):.2f} mph at {az12:.0f}°
 			"""
-		elif (args.units == "kmh"):
+		elif (units == "kmh"):
 			name = f"{(head_tail * 3.6):.2f} kmh"
 			description = f"""
 			Wind: {(magnitude * 3.6):.2f} kmh at {azimuth:.0f}°
@@ -286,7 +316,10 @@ def parse_trail(trail, ds, fp):
 			Plane: {ground_speed:.2f} m/s at {az12:.0f}°
 			"""
 
-		print(create_placemark(start_point[1], start_point[0], start_point[2], head_tail, az12, name, description), file=fp)
+		with profiling.span("write_kml"):
+			print(create_placemark(start_point[1], start_point[0], start_point[2], head_tail, az12, name, description), file=fp)
+
+		profiling.count("segments")
 
 	# Close out the folder
 	print("</Folder>", file=fp)
@@ -298,38 +331,98 @@ def parse_trail(trail, ds, fp):
 
 ######################################################################
 
-tree = ET.parse(args.kmlfile)
-root = tree.getroot()
+def analyse(kmlfile, fp, speed=250, level=250, units="mps", out=sys.stdout, log=sys.stderr, get_dataset=grib_downloader.get_dataset, archive=None):
+
+	# Writes the *bEtTeR* KML for a FlightRadar24 KML file to fp (or to what
+	# fp() returns, called once the wind data's loaded). The actual flight
+	# time goes to "out" and progress messages to "log", so a caller can
+	# collect them separately. If "archive" is given, it's called with the
+	# flight number, date and per-segment numbers (see flight_archive.append)
+	with profiling.span("parse_kml"):
+		tree = ET.parse(kmlfile)
+		root = tree.getroot()
+
+	route = root.find("kml:Document/kml:Folder[kml:name='Route']", kml_ns)
+	(takeoff_ts, landing_ts) = get_timestamps_from_route(route)
+	flight_time = landing_ts - takeoff_ts
+	print(flight_time, file=out)
+
+	kmldate = takeoff_ts.strftime("%Y-%m-%d")
+	print("KML date: " + kmldate, file=log)
+
+	try:
+		with profiling.span("get_dataset"):
+			ds = get_dataset(kmldate, level)
+	except urllib.error.HTTPError as e:
+		print(e, file=out)
+		return None
+
+	if (callable(fp)):
+		fp = fp()
 
-route = root.find("kml:Document/kml:Folder[kml:name='Route']", kml_ns)
-(takeoff_ts, landing_ts) = get_timestamps_from_route(route)
-flight_time = landing_ts - takeoff_ts
-print(flight_time)
+	flight_number = root.find("kml:Document/kml:name", kml_ns)
+	name = f"{(flight_number.text)} - {kmldate} - Actual Flight Time: {flight_time}"
 
-kmldate = takeoff_ts.strftime("%Y-%m-%d")
-print("KML date: " + kmldate, file=sys.stderr)
+	endpoints = get_airports_from_route(route)
+	if (endpoints):
+		name = f"{(flight_number.text)} - {endpoints[0]} to {endpoints[1]} - {kmldate} - Actual Flight Time: {flight_time}"
 
-try:
-	ds = grib_downloader.get_dataset(kmldate, args.level)
-except urllib.error.HTTPError as e:
-	print(e)
-	exit()
+	print(kml_header(name), file=fp)
 
-# Output file
-if (args.out):
-	fp = open(args.out, "w")
-else:
-	fp = sys.stdout
+	trail = root.find("kml:Document/kml:Folder[kml:name='Trail']", kml_ns)
+	rows = [] if archive else None
 
-flight_number = root.find("kml:Document/kml:name", kml_ns)
-name = f"{(flight_number.text)} - {kmldate} - Actual Flight Time: {flight_time}"
+	with profiling.span("parse_trail"):
+		parse_trail(trail, ds, fp, speed, units, rows, get_times_from_route(route) if archive else None, takeoff_ts)
 
-print(kml_header(name), file=fp)
+	if (archive):
+		with profiling.span("archive"):
+			archive(flight_number.text, kmldate, rows)
 
-trail = root.find("kml:Document/kml:Folder[kml:name='Trail']", kml_ns)
-parse_trail(trail, ds, fp)
+	print(kml_footer(), file=fp)
 
-print(kml_footer(), file=fp)
+	print("Done!", file=log)
 
-print("Done!", file=sys.stderr)
+	return flight_time
+
+######################################################################
+
+def main():
+
+	# Command line arguments
+	parser = argparse.ArgumentParser(
+				prog='KML Flight Analyser',
+				description='Takes a KML file from FilghtRadar24 and produces a *bEtTeR* KML file')
+
+	parser.add_argument("kmlfile") # positional argument
+	parser.add_argument("--out") # Write to a named KML file
+	parser.add_argument("-s", "--speed", type=float, help="metres per second", default=250) # speed in m/s (250 m/s = 900 km/h = 559 mph)
+	parser.add_argument("--level", type=int, choices=[300, 250, 200, 150, 50], default=250)
+	parser.add_argument("--units", choices=['mph', 'kmh', 'mps'], default='mps')
+	parser.add_argument("--archive", action="store_true", default=False, help="Also add the segments to the flight archive (see flight_archive.py)")
+	profiling.add_argument(parser)
+
+	args = parser.parse_args()
+
+	if (args.profile):
+		profiling.start(args.profile)
+
+	archive = None
+	if (args.archive):
+		import flight_archive # type: ignore
+		archive = flight_archive.append
+
+	# Output file. Only opened once the wind data's loaded, so a failed
+	# download doesn't leave an empty file behind
+	if (args.out):
+		fp = lambda: open(args.out, "w")
+	else:
+		fp = sys.stdout
+
+	if (analyse(args.kmlfile, fp, args.speed, args.level, args.units, archive=archive) is None):
+		exit()
+
+######################################################################
 
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,89 @@
+# Analysis client
+#  Sends analyse_flight.py and fastest_wind.py jobs to a running
+# analysis_server.py. Takes the same arguments and prints the same output as
+# the tools themselves, but only imports the standard library so it starts
+# straight away.
+#
+#   python analysis_client.py analyse flight.kml --out better.kml
+#   python analysis_client.py fastest --date 2024-06-18 --level 250
+import argparse
+import json
+import sys
+import urllib.error
+import urllib.request
+
+######################################################################
+
+def send_job(url, path, job):
+
+	request = urllib.request.Request(url.rstrip("/") + path, data=json.dumps(job).encode("utf-8"),
+		headers={"Content-Type": "application/json"})
+
+	with urllib.request.urlopen(request) as response:
+		return json.loads(response.read())
+
+######################################################################
+
+def main():
+
+	# Command line arguments
+	parser = argparse.ArgumentParser(
+				prog='Analysis client',
+				description='Runs jobs on a running analysis_server.py')
+
+	parser.add_argument("--server", default="http://127.0.0.1:8001", help="URL of the analysis server")
+
+	subparsers = parser.add_subparsers(dest="job", required=True)
+
+	# Same as analyse_flight.py
+	analyse = subparsers.add_parser("analyse", help="Takes a KML file from FilghtRadar24 and produces a *bEtTeR* KML file")
+	analyse.add_argument("kmlfile") # positional argument
+	analyse.add_argument("--out") # Write to a named KML file
+	analyse.add_argument("-s", "--speed", type=float, help="metres per second", default=250) # speed in m/s (250 m/s = 900 km/h = 559 mph)
+	analyse.add_argument("--level", type=int, choices=[300, 250, 200, 150, 50], default=250)
+	analyse.add_argument("--units", choices=['mph', 'kmh', 'mps'], default='mps')
+
+	# Same as fastest_wind.py
+	fastest = subparsers.add_parser("fastest", help="Finds the fastest wind anywhere on earth")
+	fastest.add_argument('--date', required=True, help="YYYY-MM-DD") # Date of the GRIB file
+	fastest.add_argument('--level', required=True, type=int, choices=[300, 250, 200, 150, 100, 50], help="hPa") # Atmospheric Level
+	fastest.add_argument("--units", choices=['mph', 'kmh', 'mps', 'kts'], default='mps')
+	fastest.add_argument('--minlat', type=float)
+	fastest.add_argument('--maxlat', type=float)
+
+	args = parser.parse_args()
+
+	job = vars(args).copy()
+	del job["server"], job["job"]
+
+	# The server doesn't touch our files: it gets the FR24 KML itself, and
+	# sends the new KML back for us to write
+	if (args.job == "analyse"):
+		del job["kmlfile"], job["out"]
+
+		with open(args.kmlfile) as fp:
+			job["kml"] = fp.read()
+
+	try:
+		result = send_job(args.server, "/" + args.job, job)
+	except urllib.error.HTTPError as e:
+		# The server turned the job down (e.g. 400 for a bad date)
+		print(f"{e.code}: {e.reason}", file=sys.stderr)
+		sys.exit(1)
+
+	print(result["stdout"], end="")
+	print(result["stderr"], end="", file=sys.stderr)
+
+	if ("kml" in result):
+		if (args.out):
+			with open(args.out, "w") as fp:
+				fp.write(result["kml"])
+		else:
+			print(result["kml"], end="")
+
+	sys.exit(result["status"])
+
+######################################################################
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,244 @@
+# Analysis server
+#  Keeps pyproj, xarray and cfgrib imported, and the most recently
+# used GRIB datasets decoded, so analyse_flight.py and fastest_wind.py jobs
+# don't pay for all of that on every run. Use analysis_client.py to talk to it.
+#
+# Jobs are POSTed as JSON to /analyse or /fastest (same arguments as the
+# command line tools), and the reply is JSON with whatever the tool would
+# have printed to stdout and stderr. The server never opens a file the client
+# names: /analyse takes the FR24 KML itself and sends the *bEtTeR* KML back
+# in the reply, for the client to save. Only application/json requests are
+# accepted, so a web page can't slip a job in as a plain form post, and a job
+# whose date, level or units the command line tool wouldn't take gets a 400.
+import argparse
+import concurrent.futures
+import datetime
+import functools
+import http.server
+import io
+import json
+import sys
+import threading
+import analyse_flight # type: ignore
+import fastest_wind # type: ignore
+import grib_downloader # type: ignore
+
+# How many decoded GRIB files to keep hold of
+DATASET_CACHE_SIZE = 16
+
+# What the command line tools accept for each job
+ANALYSE_LEVELS = [300, 250, 200, 150, 50]
+ANALYSE_UNITS = ['mph', 'kmh', 'mps']
+FASTEST_LEVELS = [300, 250, 200, 150, 100, 50]
+FASTEST_UNITS = ['mph', 'kmh', 'mps', 'kts']
+
+# (date, level) -> lock, so only jobs that want the same file wait for it
+# to download and decode
+dataset_locks = {}
+
+######################################################################
+
+@functools.lru_cache(maxsize=DATASET_CACHE_SIZE)
+def load_dataset(date, level):
+
+	# Pull all the values into memory now, so the worker threads can share
+	# the dataset without going back to cfgrib
+	return grib_downloader.get_dataset(date, level).load()
+
+######################################################################
+
+def get_dataset(date, level):
+
+	# The cache is checked under the file's lock, so jobs that want a file
+	# that's being decoded wait for it rather than decoding it again. Other
+	# files (and cache hits) aren't held up. setdefault() is atomic, so two
+	# threads can't end up with different locks
+	with dataset_locks.setdefault((date, level), threading.Lock()):
+		return load_dataset(date, level)
+
+######################################################################
+
+def warm_up():
+
+	# The tools only import these when they first need them, so get that out
+	# of the way before the first job arrives
+	import cfgrib # type: ignore
+	import xarray # type: ignore
+
+	analyse_flight.get_geod()
+
+######################################################################
+
+def run_analyse(job, out, log):
+
+	# The FR24 KML comes in the job, and the new KML goes back in the reply
+	kml = io.StringIO()
+	analyse_flight.analyse(io.StringIO(job["kml"]), kml, job["speed"], job["level"], job["units"], out, log, get_dataset)
+
+	return {"kml": kml.getvalue()}
+
+######################################################################
+
+def run_fastest(job, out, log):
+
+	fastest_wind.get_fastest_wind(job["date"], job["level"], job["units"], job.get("minlat"), job.get("maxlat"), out, get_dataset)
+
+######################################################################
+
+def check_choice(job, key, choices):
+
+	value = job.get(key)
+
+	if (type(value) is not type(choices[0]) or value not in choices):
+		raise ValueError(f"{key} must be one of {choices}")
+
+######################################################################
+
+def check_number(job, key, optional=False):
+
+	value = job.get(key)
+
+	if (optional and value is None):
+		return
+
+	if (type(value) not in (int, float)):
+		raise ValueError(f"{key} must be a number")
+
+######################################################################
+
+def check_job(path, job):
+
+	# The date and level end up in a GRIB file name and a download URL, so
+	# only run jobs the command line tools would have accepted. Raises
+	# ValueError if it's not one
+	if (not isinstance(job, dict)):
+		raise ValueError("the job must be a JSON object")
+
+	if (path == "/analyse"):
+		if (not isinstance(job.get("kml"), str)):
+			raise ValueError("kml must be the FR24 KML file's contents")
+
+		check_number(job, "speed")
+		if (job["speed"] <= 0):
+			raise ValueError("speed must be more than 0")
+
+		check_choice(job, "level", ANALYSE_LEVELS)
+		check_choice(job, "units", ANALYSE_UNITS)
+
+	else:
+		try:
+			date = datetime.date.fromisoformat(job.get("date"))
+		except (TypeError, ValueError):
+			date = None
+
+		if (date is None or date.isoformat() != job["date"]):
+			raise ValueError("date must be YYYY-MM-DD")
+
+		check_choice(job, "level", FASTEST_LEVELS)
+		check_choice(job, "units", FASTEST_UNITS)
+		check_number(job, "minlat", optional=True)
+		check_number(job, "maxlat", optional=True)
+
+######################################################################
+
+jobs = {
+	"/analyse": run_analyse,
+	"/fastest": run_fastest
+}
+
+######################################################################
+
+def run_job(path, job):
+
+	# Returns what the command line tool would have printed, its exit status,
+	# and anything else the job sends back
+	out = io.StringIO()
+	log = io.StringIO()
+	status = 0
+	extra = None
+
+	try:
+		extra = jobs[path](job, out, log)
+	except SystemExit:
+		# grib_downloader quits when a download fails
+		status = 1
+	except Exception as e:
+		print(f"{type(e).__name__}: {e}", file=log)
+		status = 1
+
+	return dict(extra or {}, stdout=out.getvalue(), stderr=log.getvalue(), status=status)
+
+######################################################################
+
+class JobHandler(http.server.BaseHTTPRequestHandler):
+
+	def do_POST(self):
+
+		if (self.path not in jobs):
+			self.send_error(404)
+			return
+
+		if (self.headers.get_content_type() != "application/json"):
+			self.send_error(415)
+			return
+
+		try:
+			length = int(self.headers.get("Content-Length", 0))
+			job = json.loads(self.rfile.read(length))
+			check_job(self.path, job)
+		except ValueError as e:
+			self.send_error(400, str(e))
+			return
+
+		# The request thread waits while a worker runs the job
+		result = self.server.executor.submit(run_job, self.path, job).result()
+		body = json.dumps(result).encode("utf-8")
+
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+######################################################################
+
+def make_server(host="127.0.0.1", port=8001, workers=None):
+
+	server = http.server.ThreadingHTTPServer((host, port), JobHandler)
+	server.daemon_threads = True
+	server.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+	return server
+
+######################################################################
+
+def main():
+
+	# Command line arguments
+	parser = argparse.ArgumentParser(
+				prog='Analysis server',
+				description='Runs analyse_flight and fastest_wind jobs with everything kept warm')
+
+	parser.add_argument('--host', default="127.0.0.1")
+	parser.add_argument('--port', type=int, default=8001)
+	parser.add_argument('--workers', type=int, help="Number of jobs to run at once")
+
+	args = parser.parse_args()
+
+	warm_up()
+
+	server = make_server(args.host, args.port, args.workers)
+	print(f"Serving on http://{args.host}:{server.server_address[1]}/", file=sys.stderr)
+
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+	server.server_close()
+	server.executor.shutdown()
+
+######################################################################
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,296 @@
+# Benchmarks
+#  Times the hot paths of the tools on synthetic data (see synthetic.py), so
+# they can be run offline, and compares the results against a stored baseline
+# to catch regressions.
+#
+#   python benchmark.py --save-baseline     # record where we are now
+#   python benchmark.py                     # compare against it
+#
+# Exits with status 1 if anything got slower than the baseline by more than
+# --tolerance.
+import argparse
+import datetime
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+import numpy as np
+import synthetic # type: ignore
+
+BASELINE_FILE = "benchmark_baseline.json"
+
+RESOLUTIONS = [1.0, 0.5, 0.25]
+
+# name -> (setup function, resolutions it can run at)
+benchmarks = {}
+
+######################################################################
+
+def benchmark(name, resolutions=None):
+
+	# Registers a setup function. It's called with the wind dataset (None if
+	# the benchmark doesn't need one) and the --points setting, and returns
+	# the function to time and how many operations each call performs
+	def register(setup):
+		benchmarks[name] = (setup, resolutions)
+		return setup
+
+	return register
+
+######################################################################
+
+@benchmark("fastest_wind", resolutions=[1.0])
+def bench_fastest_wind(ds, points):
+
+	# Walks every cell through xarray, so finer grids take minutes
+	import fastest_wind # type: ignore
+
+	def run():
+		fastest_wind.get_fastest_wind("2024-06-18", 250, "kts", fp=io.StringIO(), get_dataset=lambda date, level: ds)
+
+	return run, ds.u.size
+
+######################################################################
+
+@benchmark("get_wind", resolutions=[1.0])
+def bench_get_wind(ds, points):
+
+	# analyse_flight.get_wind only understands a 1° grid
+	import analyse_flight # type: ignore
+
+	positions = [(lon, lat) for (lat, lon) in zip(*synthetic_track(points))]
+
+	def run():
+		for position in positions:
+			analyse_flight.get_wind(position, ds)
+
+	return run, len(positions)
+
+######################################################################
+
+@benchmark("parse_trail", resolutions=[1.0])
+def bench_parse_trail(ds, points):
+
+	import analyse_flight # type: ignore
+
+	root = ET.fromstring(synthetic.flight_kml(points))
+	trail = root.find("kml:Document/kml:Folder[kml:name='Trail']", analyse_flight.kml_ns)
+
+	def run():
+		analyse_flight.parse_trail(trail, ds, io.StringIO())
+
+	return run, points - 1
+
+######################################################################
+
+@benchmark("wind_arrays", resolutions=RESOLUTIONS)
+def bench_wind_arrays(ds, points):
+
+	import grib_to_placemarks # type: ignore
+
+	def run():
+		grib_to_placemarks.wind_arrays(ds)
+
+	return run, ds.u.size
+
+######################################################################
+
+@benchmark("render_placemarks", resolutions=RESOLUTIONS)
+def bench_render_placemarks(ds, points):
+
+	# Every NetworkLink's placemarks for a whole day
+	import grib_to_placemarks # type: ignore
+
+	wind = grib_to_placemarks.wind_arrays(ds)
+
+	def run():
+		for nw_link in grib_to_placemarks.links:
+			grib_to_placemarks.render_link(wind, nw_link)
+
+	return run, ds.u.size
+
+######################################################################
+
+@benchmark("route_distances")
+def bench_route_distances(ds, points):
+
+	# All four metrics for every pair of airports. The distances are
+	# memoized, so go around the cache
+	import route_distance # type: ignore
+
+	pairs = [route_distance.parse_location(orig) + route_distance.parse_location(dest)
+		for (orig, dest) in route_distance.airport_pairs()]
+
+	def run():
+		for pair in pairs:
+			route_distance.cached_distances.__wrapped__(*pair)
+
+	return run, len(pairs)
+
+######################################################################
+
+@benchmark("jet_cores", resolutions=[1.0])
+def bench_jet_cores(ds, points):
+
+	# A year of the same day, found and tracked in one go. That's what
+	# grib_downloader fetches; a year of finer grids doesn't fit in memory
+	import jet_cores # type: ignore
+
+	days = 365
+	wind = {
+		"latitude": ds.latitude.values.astype(np.float64),
+		"longitude": ds.longitude.values.astype(np.float64),
+		"u": np.broadcast_to(ds.u.values.astype(np.float64), (days,) + ds.u.shape),
+		"v": np.broadcast_to(ds.v.values.astype(np.float64), (days,) + ds.v.shape)
+	}
+	dates = synthetic_dates(days)
+
+	def run():
+		jet_cores.jet_cores(wind, dates)
+
+	return run, days
+
+######################################################################
+
+def synthetic_track(points):
+
+	import route_distance # type: ignore
+
+	(lat1, lon1) = route_distance.parse_location("sydney")
+	(lat2, lon2) = route_distance.parse_location("santiago")
+	(lats, lons) = route_distance.globe_track(lat1, lon1, lat2, lon2, max(points - 1, 1))
+
+	return (lats.tolist(), [lon - 360 if lon > 180 else lon for lon in lons.tolist()])
+
+######################################################################
+
+def synthetic_dates(days):
+
+	first = datetime.date(2024, 1, 1)
+
+	return [(first + datetime.timedelta(days=n)).isoformat() for n in range(days)]
+
+######################################################################
+
+def measure(run, ops, repeat, memory=True):
+
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		run()
+		times.append(time.perf_counter() - start)
+
+	result = {
+		"best_seconds": min(times),
+		"median_seconds": statistics.median(times),
+		"ops": ops,
+		"ops_per_second": ops / min(times)
+	}
+
+	# tracemalloc slows everything down, so measure memory in a separate run
+	if (memory):
+		tracemalloc.start()
+		run()
+		result["peak_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+		tracemalloc.stop()
+
+	return result
+
+######################################################################
+
+def run_benchmarks(names, points, repeat, memory=True, log=sys.stderr):
+
+	results = {}
+	datasets = {}
+
+	for name in names:
+		(setup, resolutions) = benchmarks[name]
+
+		for resolution in (resolutions or [None]):
+			key = name if resolution is None else f"{name}@{resolution}"
+
+			if (resolution is not None and resolution not in datasets):
+				datasets[resolution] = synthetic.wind_dataset(resolution).load()
+
+			(run, ops) = setup(datasets.get(resolution), points)
+			results[key] = measure(run, ops, repeat, memory)
+
+			print(f"{key:30} {results[key]['best_seconds']:10.4f} s {results[key]['ops_per_second']:14.0f} ops/s", file=log)
+
+	return results
+
+######################################################################
+
+def compare(results, baseline, tolerance):
+
+	# Returns the benchmarks that are more than "tolerance" (a fraction)
+	# slower than the baseline
+	regressions = []
+
+	for (key, result) in results.items():
+		if (key not in baseline):
+			continue
+
+		ratio = result["best_seconds"] / baseline[key]["best_seconds"]
+		print(f"{key:30} {ratio:6.2f}x baseline", file=sys.stderr)
+
+		if (ratio > 1 + tolerance):
+			regressions.append(key)
+
+	return regressions
+
+######################################################################
+
+def main():
+
+	# Command line arguments
+	parser = argparse.ArgumentParser(
+				prog='Benchmarks',
+				description='Times the tools on synthetic data and compares against a baseline')
+
+	parser.add_argument('-k', '--filter', help="Only run benchmarks whose name contains this")
+	parser.add_argument('--points', type=int, default=1000, help="Positions in the synthetic flight")
+	parser.add_argument('--repeat', type=int, default=3, help="Times to run each benchmark (the best is kept)")
+	parser.add_argument('--no-memory', action="store_true", default=False, help="Skip the peak memory measurement")
+	parser.add_argument('--baseline', default=BASELINE_FILE, help="Baseline results file")
+	parser.add_argument('--save-baseline', action="store_true", default=False, help="Write these results as the new baseline")
+	parser.add_argument('--tolerance', type=float, default=0.2, help="Fraction slower than the baseline that counts as a regression")
+	parser.add_argument("--out") # Write the results to a named JSON file
+
+	args = parser.parse_args()
+
+	names = [name for name in benchmarks if not args.filter or args.filter in name]
+	results = run_benchmarks(names, args.points, args.repeat, not args.no_memory)
+
+	if (args.out):
+		with open(args.out, "w") as fp:
+			json.dump(results, fp, indent=2)
+
+	if (args.save_baseline):
+		# Keep the baseline for any benchmarks we didn't run this time
+		baseline = {}
+		if (os.path.isfile(args.baseline)):
+			with open(args.baseline) as fp:
+				baseline = json.load(fp)
+
+		baseline.update(results)
+
+		with open(args.baseline, "w") as fp:
+			json.dump(baseline, fp, indent=2)
+
+	elif (os.path.isfile(args.baseline)):
+		with open(args.baseline) as fp:
+			regressions = compare(results, json.load(fp), args.tolerance)
+
+		if (regressions):
+			print("Slower than the baseline: " + ", ".join(regressions), file=sys.stderr)
+			sys.exit(1)
+
+######################################################################
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,298 @@
+# Climatology
+#  Per-cell wind statistics for every level and calendar month in the GRIB
+# archive: mean and maximum speed, percentiles, and the dominant direction.
+#
+# Each day is folded into running totals for its (level, month) as soon as
+# it's decoded, so the archive never has to be in memory at once. Speeds go
+# into a fixed histogram per cell, which is what the percentiles come from
+# (to within a bin), and directions into one per compass sector.
+# Histograms just add up, so worker processes fold separate days and the
+# parent merges what they send back.
+#
+# The running totals are checkpointed in data/climatology/, along with which
+# days are already in them, so only new days are folded in next time. The
+# statistics are written next to them as small float32 arrays, which
+# grib_to_placemarks.py --climatology can render as a layer.
+import argparse
+import concurrent.futures
+import os
+import re
+import sys
+import numpy as np
+import grib_downloader # type: ignore
+import profiling # type: ignore
+import wind_route # type: ignore
+
+CLIMATOLOGY_DIR = grib_downloader.DATA_DIR + "climatology/"
+
+# Speed histogram: BINS bins of BIN_WIDTH m/s, and anything faster goes in
+# the last one. The counts are uint16, which is good for a couple of
+# thousand years of any one month
+BIN_WIDTH = 2
+BINS = 64
+
+# Compass sectors for the dominant direction
+SECTORS = 16
+
+QUANTILES = {
+	"p50": 0.5,
+	"p90": 0.9,
+	"p99": 0.99
+}
+
+GRIB_FILENAME = re.compile(r"(\d{4}-\d\d-\d\d)_(\d+)\.grib$")
+
+######################################################################
+
+def empty_state(latitude, longitude):
+
+	shape = (len(latitude), len(longitude))
+
+	return {
+		"latitude": latitude,
+		"longitude": longitude,
+		"days": np.array([], dtype="U10"),
+		"sum": np.zeros(shape),
+		"max": np.zeros(shape, dtype=np.float32),
+		"histogram": np.zeros((BINS,) + shape, dtype=np.uint16),
+		"sectors": np.zeros((SECTORS,) + shape, dtype=np.uint16)
+	}
+
+######################################################################
+
+def fold(state, date, u_vals, v_vals):
+
+	# Adds one day's u/v grids to the running totals
+	speed = np.sqrt(u_vals**2 + v_vals**2)
+
+	state["sum"] += speed
+	np.maximum(state["max"], speed, out=state["max"])
+
+	# Every cell goes up by one in exactly one bin, so a plain fancy-index
+	# increment is safe (no repeated indices)
+	cells = np.arange(speed.size)
+
+	bins = np.minimum(speed // BIN_WIDTH, BINS - 1).astype(np.intp)
+	state["histogram"].reshape(BINS, -1)[bins.ravel(), cells] += 1
+
+	azimuth = wind_route.calculate_azimuths(u_vals, v_vals)
+	sector = ((azimuth + 180 / SECTORS) // (360 / SECTORS)).astype(np.intp) % SECTORS
+	state["sectors"].reshape(SECTORS, -1)[sector.ravel(), cells] += 1
+
+	state["days"] = np.append(state["days"], date)
+
+######################################################################
+
+def merge(state, other):
+
+	# Adds the totals from other (on the same grid, with different days) to state
+	if (state is None):
+		return other
+
+	state["sum"] += other["sum"]
+	np.maximum(state["max"], other["max"], out=state["max"])
+	state["histogram"] += other["histogram"]
+	state["sectors"] += other["sectors"]
+	state["days"] = np.append(state["days"], other["days"])
+
+	return state
+
+######################################################################
+
+def fold_days(dates, level):
+
+	# Runs in a worker process: the running totals for just these days
+	state = None
+
+	for date in dates:
+		ds = grib_downloader.get_dataset(date, level)
+
+		if (state is None):
+			state = empty_state(ds.latitude.values.astype(np.float64), ds.longitude.values.astype(np.float64))
+
+		fold(state, date, ds.u.values.astype(np.float64), ds.v.values.astype(np.float64))
+
+	return state
+
+######################################################################
+
+def quantile(histogram, count, q):
+
+	# The speed below which q of the days fall, in every cell, interpolated
+	# within the bin it lands in
+	target = q * count
+	cumulative = np.cumsum(histogram, axis=0, dtype=np.int32)
+
+	idx = np.argmax(cumulative >= target, axis=0)[None]
+	before = np.take_along_axis(cumulative, idx, axis=0)[0] - np.take_along_axis(histogram, idx, axis=0)[0]
+	within = np.take_along_axis(histogram, idx, axis=0)[0]
+
+	return (idx[0] + (target - before) / np.maximum(within, 1)) * BIN_WIDTH
+
+######################################################################
+
+def statistics(state):
+
+	# The compact arrays that get written out and rendered
+	count = len(state["days"])
+
+	stats = {
+		"latitude": state["latitude"].astype(np.float32),
+		"longitude": state["longitude"].astype(np.float32),
+		"days": np.array(count),
+		"mean": (state["sum"] / count).astype(np.float32),
+		"max": state["max"]
+	}
+
+	# The last bin is open ended, so don't let a percentile go past the maximum
+	for (name, q) in QUANTILES.items():
+		stats[name] = np.minimum(quantile(state["histogram"], count, q), state["max"]).astype(np.float32)
+
+	# The middle of the most common sector
+	stats["direction"] = (np.argmax(state["sectors"], axis=0) * (360 / SECTORS)).astype(np.float32)
+
+	return stats
+
+######################################################################
+
+def state_filename(level, month):
+
+	return os.path.join(CLIMATOLOGY_DIR, f"state_{level}_{month:02}.npz")
+
+######################################################################
+
+def layer_filename(level, month):
+
+	return os.path.join(CLIMATOLOGY_DIR, f"{level}_{month:02}.npz")
+
+######################################################################
+
+def load_state(level, month):
+
+	filename = state_filename(level, month)
+
+	if (not os.path.isfile(filename)):
+		return None
+
+	with np.load(filename) as arrays:
+		return {key: arrays[key] for key in arrays.files}
+
+######################################################################
+
+def save(filename, arrays, compressed=False):
+
+	# Write to a temporary file first, so an interrupted run can't leave a
+	# half-written checkpoint behind
+	temp = filename + ".tmp.npz"
+
+	if (compressed):
+		np.savez_compressed(temp, **arrays)
+	else:
+		np.savez(temp, **arrays)
+
+	os.replace(temp, filename)
+
+######################################################################
+
+def archive(levels=None):
+
+	# (level, month) -> dates of every GRIB file in the data directory
+	groups = {}
+
+	for f in sorted(os.listdir(grib_downloader.DATA_DIR)):
+		match = GRIB_FILENAME.match(f)
+
+		if (match):
+			(date, level) = (match.group(1), int(match.group(2)))
+
+			if (levels is None or level in levels):
+				groups.setdefault((level, int(date[5:7])), []).append(date)
+
+	return groups
+
+######################################################################
+
+def chunks(items, n):
+
+	# Splits items into n nearly equal runs
+	size = -(-len(items) // n)
+
+	return [items[idx:idx + size] for idx in range(0, len(items), size)]
+
+######################################################################
+
+def update(levels=None, workers=None, rebuild=False, log=sys.stderr):
+
+	# Folds any new days into the checkpoint for each (level, month), and
+	# rewrites its statistics. One (level, month) is in memory at a time
+	os.makedirs(CLIMATOLOGY_DIR, exist_ok=True)
+
+	with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+		for ((level, month), dates) in sorted(archive(levels).items()):
+
+			state = None if rebuild else load_state(level, month)
+
+			if (state is not None):
+				dates = sorted(set(dates) - set(state["days"].tolist()))
+
+			if (not dates):
+				continue
+
+			with profiling.span("fold"):
+				parts = [executor.submit(fold_days, part, level) for part in chunks(dates, workers or os.cpu_count() or 1)]
+
+				for future in concurrent.futures.as_completed(parts):
+					with profiling.span("merge"):
+						state = merge(state, future.result())
+
+			profiling.count("days", len(dates))
+
+			with profiling.span("checkpoint"):
+				save(state_filename(level, month), state)
+
+			with profiling.span("statistics"):
+				save(layer_filename(level, month), statistics(state), compressed=True)
+
+			print(f"{level} hPa, month {month:02}: {len(dates)} new days, {len(state['days'])} in total", file=log)
+
+######################################################################
+
+def load_layer(filename, stat="mean"):
+
+	# One statistic as a grib_to_placemarks wind array, with the dominant
+	# direction for the arrows
+	with np.load(filename) as arrays:
+		lats, lons = np.meshgrid(arrays["latitude"].astype(np.float64), arrays["longitude"].astype(np.float64), indexing="ij")
+
+		return {
+			"latitude": lats,
+			"longitude": lons,
+			"magnitude": arrays[stat].astype(np.float64),
+			"azimuth": arrays["direction"].astype(int)
+		}
+
+######################################################################
+
+def main():
+
+	# Command line arguments
+	parser = argparse.ArgumentParser(
+				prog='Climatology',
+				description='Folds the GRIB archive into per-cell statistics for each level and month')
+
+	parser.add_argument("--level", type=int, action="append", choices=[300, 250, 200, 150, 100, 50], help="hPa (can be repeated, default: every level in the archive)")
+	parser.add_argument('--workers', type=int, help="Number of processes (default: one per CPU)")
+	parser.add_argument('--rebuild', action="store_true", default=False, help="Ignore the checkpoints and start again")
+	profiling.add_argument(parser)
+
+	args = parser.parse_args()
+
+	if (args.profile):
+		profiling.start(args.profile)
+
+	update(args.level, args.workers, args.rebuild)
+
+######################################################################
+
+if __name__ == "__main__":
+	main()
@@ -1,6 +1,8 @@
 import argparse
 import math
+import sys
 import grib_downloader # type: ignore
+import profiling # type: ignore
 
 ######################################################################
 
@@ -16,54 +18,59 @@ def calculate_azimuth(u_val, v_val):
 
 ######################################################################
 
-def get_fastest_wind(date, level, units="mps", minlat=None, maxlat=None):
+def get_fastest_wind(date, level, units="mps", minlat=None, maxlat=None, fp=sys.stdout, get_dataset=grib_downloader.get_dataset):
 
-	ds = grib_downloader.get_dataset(date, level)
-	arr = ds.to_array()
+	with profiling.span("get_dataset"):
+		ds = get_dataset(date, level)
+		arr = ds.to_array()
 
 	max_values = len(ds.latitude.values) * len(ds.longitude.values)
 	max_magnitude = 0
 
-	for lat_idx in range(len(arr.latitude)):
-		for lon_idx in range(len(arr.longitude)):
+	with profiling.span("search"):
+		for lat_idx in range(len(arr.latitude)):
+			for lon_idx in range(len(arr.longitude)):
 			
-			u_val = arr[0, lat_idx, lon_idx]
-			v_val = arr[1, lat_idx, lon_idx]
+				u_val = arr[0, lat_idx, lon_idx]
+				v_val = arr[1, lat_idx, lon_idx]
 
-			this_lat = float(u_val.latitude.values)
-			this_lon = float(u_val.longitude.values)
+				this_lat = float(u_val.latitude.values)
+				this_lon = float(u_val.longitude.values)
 
-			if (minlat):
-				if (abs(this_lat) < minlat):
-					continue
+				if (minlat):
+					if (abs(this_lat) < minlat):
+						continue
 
-			if (maxlat):
-				if (abs(this_lat) > maxlat):
-					continue
+				if (maxlat):
+					if (abs(this_lat) > maxlat):
+						continue
 
-			u_val_ms = u_val.values
-			v_val_ms = v_val.values
+				u_val_ms = u_val.values
+				v_val_ms = v_val.values
 
-			magnitude = math.sqrt(u_val_ms**2 + v_val_ms**2) # metres per second
+				magnitude = math.sqrt(u_val_ms**2 + v_val_ms**2) # metres per second
 			
-			if (units == "mph"):
-				magnitude *= 2.23694
-			elif (units == "kmh"):
-				magnitude *= 3.6
-			elif (units == "kts"):
-				magnitude *= 1.94384
+				if (units == "mph"):
+					magnitude *= 2.23694
+				elif (units == "kmh"):
+					magnitude *= 3.6
+				elif (units == "kts"):
+					magnitude *= 1.94384
 
-			azimuth = calculate_azimuth(u_val_ms, v_val_ms)
+				azimuth = calculate_azimuth(u_val_ms, v_val_ms)
 
-			if (magnitude > max_magnitude):
-				max_magnitude = magnitude
-				position = f"{azimuth},{this_lat},{this_lon}"
+				if (magnitude > max_magnitude):
+					max_magnitude = magnitude
+					position = f"{azimuth},{this_lat},{this_lon}"
 
-	print(",".join((date, str(level), f"{max_magnitude:.2f}", units, position)))
+	profiling.count("cells", max_values)
+
+	print(",".join((date, str(level), f"{max_magnitude:.2f}", units, position)), file=fp)
 
 ######################################################################
 
-if __name__ == "__main__":
+def main():
+
 	# Command line arguments
 	parser = argparse.ArgumentParser(
 				prog='Fastest wind',
@@ -74,8 +81,17 @@ if __name__ == "__main__":
 	parser.add_argument("--units", choices=['mph', 'kmh', 'mps', 'kts'], default='mps')
 	parser.add_argument('--minlat', type=float)
 	parser.add_argument('--maxlat', type=float)
+	profiling.add_argument(parser)
 
 	args = parser.parse_args()
 
+	if (args.profile):
+		profiling.start(args.profile)
+
 	# Finally!
 	get_fastest_wind(args.date, args.level, args.units, args.minlat, args.maxlat)
+
+######################################################################
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,512 @@
+# Flight archive
+#  Keeps the per-segment numbers from every analyse_flight.py run (time,
+# position, altitude, wind, head/tail wind, ground speed...) so they can be
+# queried without analysing everything again.
+#
+#   python analyse_flight.py flight.kml --out better.kml --archive
+#   python flight_archive.py ingest *.kml
+#   python flight_archive.py query --minlat -50 --maxlat -40 --min-wind 150 --units kts --flights
+#
+# The archive is partitioned by date (data/flights/YYYY-MM-DD/), and each
+# flight is a "part" in there: a directory with a .npy file per column,
+# sorted by CELL_SIZE° cell, plus where each cell's rows start. Every date
+# has an index.json with the time span, bounding box and wind range of each
+# part. A query skips dates outside its time window, then parts whose index
+# entry can't match, then cells that can't match, and only reads the rows
+# of the cells that are left (the columns are memory mapped).
+#
+# Lots of small parts make for lots of files to open, so "compact" merges a
+# date's parts into one.
+import argparse
+import csv
+import datetime
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import numpy as np
+import grib_downloader # type: ignore
+import profiling # type: ignore
+
+ARCHIVE_DIR = grib_downloader.DATA_DIR + "flights/"
+
+CELL_SIZE = 5 # degrees
+
+# In the order analyse_flight.parse_trail() gives them. Times are seconds
+# since 1970 (UTC), speeds are metres per second and angles are degrees
+COLUMNS = ["time", "latitude", "longitude", "altitude", "wind", "wind_azimuth", "heading", "head_tail", "ground_speed", "distance", "seconds"]
+
+UNITS = {
+	"mps": 1.0,
+	"mph": 2.23694,
+	"kmh": 3.6,
+	"kts": 1.94384
+}
+
+######################################################################
+
+def cell_ids(lats, lons):
+
+	# Longitudes are -180 to 180, like FR24's
+	rows = np.clip((np.asarray(lats) + 90) // CELL_SIZE, 0, 180 // CELL_SIZE - 1)
+	cols = ((np.asarray(lons) + 180) // CELL_SIZE) % (360 // CELL_SIZE)
+
+	return (rows * (360 // CELL_SIZE) + cols).astype(np.int32)
+
+######################################################################
+
+def longitude_inside(lons, minlon, maxlon):
+
+	# A box with minlon > maxlon crosses 180°
+	if (minlon <= maxlon):
+		return (lons >= minlon) & (lons <= maxlon)
+
+	return (lons >= minlon) | (lons <= maxlon)
+
+######################################################################
+
+def cells_inside(cells, bbox):
+
+	# Which cells overlap bbox (minlat, maxlat, minlon, maxlon)
+	(minlat, maxlat, minlon, maxlon) = bbox
+
+	south = (cells // (360 // CELL_SIZE)) * CELL_SIZE - 90
+	west = (cells % (360 // CELL_SIZE)) * CELL_SIZE - 180
+
+	inside = (south <= maxlat) & (south + CELL_SIZE >= minlat)
+
+	if (minlon <= maxlon):
+		return inside & (west <= maxlon) & (west + CELL_SIZE >= minlon)
+
+	return inside & ((west <= maxlon) | (west + CELL_SIZE >= minlon))
+
+######################################################################
+
+def part_name(flight, rows):
+
+	# Unique within the date, and the same each time the flight is archived
+	return re.sub(r"[^\w-]", "_", flight) + f"_{int(rows['time'].min())}"
+
+######################################################################
+
+def load_index(date):
+
+	filename = os.path.join(ARCHIVE_DIR, date, "index.json")
+
+	if (not os.path.isfile(filename)):
+		return {}
+
+	with open(filename) as fp:
+		return json.load(fp)
+
+######################################################################
+
+def save_index(date, index):
+
+	filename = os.path.join(ARCHIVE_DIR, date, "index.json")
+
+	with open(filename + ".tmp", "w") as fp:
+		json.dump(index, fp, indent=1)
+
+	os.replace(filename + ".tmp", filename)
+
+######################################################################
+
+def write_part(date, name, columns):
+
+	# Writes the columns (a dict of equal length arrays, including "flight")
+	# sorted by cell, and returns the part's index entry
+	cells = cell_ids(columns["latitude"], columns["longitude"])
+	order = np.lexsort((columns["time"], cells))
+
+	directory = os.path.join(ARCHIVE_DIR, date, name)
+	temp = directory + ".tmp"
+
+	shutil.rmtree(temp, ignore_errors=True)
+	os.makedirs(temp)
+
+	for (column, values) in columns.items():
+		np.save(os.path.join(temp, column + ".npy"), values[order])
+
+	# Where each cell's rows start (and the fastest wind in it, so a query
+	# can skip cells without reading them)
+	cells = cells[order]
+	(present, starts) = np.unique(cells, return_index=True)
+	cell_max_wind = np.maximum.reduceat(columns["wind"][order], starts)
+
+	np.save(os.path.join(temp, "cells.npy"), present)
+	np.save(os.path.join(temp, "starts.npy"), np.append(starts, len(cells)))
+	np.save(os.path.join(temp, "cell_max_wind.npy"), cell_max_wind)
+
+	shutil.rmtree(directory, ignore_errors=True)
+	os.replace(temp, directory)
+
+	return {
+		"rows": len(cells),
+		"flights": sorted(set(columns["flight"].tolist())),
+		"start": float(columns["time"].min()),
+		"end": float(columns["time"].max()),
+		"minlat": float(columns["latitude"].min()),
+		"maxlat": float(columns["latitude"].max()),
+		"minlon": float(columns["longitude"].min()),
+		"maxlon": float(columns["longitude"].max()),
+		"max_wind": float(columns["wind"].max()),
+		"min_head_tail": float(columns["head_tail"].min()),
+		"max_head_tail": float(columns["head_tail"].max())
+	}
+
+######################################################################
+
+def remove_flight(date, index, flight, keep=None):
+
+	# Takes a flight's rows out of every part of the date (apart from the
+	# part called "keep"). Parts with nothing else in them are deleted, and
+	# compacted parts are rewritten without it. Updates index in place
+	for (name, entry) in list(index.items()):
+		if (name == keep or flight not in entry["flights"]):
+			continue
+
+		if (entry["flights"] == [flight]):
+			shutil.rmtree(os.path.join(ARCHIVE_DIR, date, name), ignore_errors=True)
+			del index[name]
+		else:
+			columns = read_part(date, name, COLUMNS + ["flight"])
+			others = columns["flight"] != flight
+
+			index[name] = write_part(date, name, {column: values[others] for (column, values) in columns.items()})
+
+######################################################################
+
+def append(flight, date, rows):
+
+	# Adds one flight's segments (tuples in COLUMNS order, as collected by
+	# analyse_flight.parse_trail()) to the archive. A flight number is one
+	# flight per date, so archiving it again replaces what was there
+	if (not rows):
+		return
+
+	values = np.array(rows, dtype=np.float64)
+	columns = {column: values[:, idx] for (idx, column) in enumerate(COLUMNS)}
+	columns["flight"] = np.full(len(rows), flight)
+
+	name = part_name(flight, columns)
+
+	with profiling.span("write_part"):
+		entry = write_part(date, name, columns)
+
+	index = load_index(date)
+
+	with profiling.span("remove_flight"):
+		remove_flight(date, index, flight, keep=name)
+
+	index[name] = entry
+	save_index(date, index)
+
+	profiling.count("archived_segments", len(rows))
+
+######################################################################
+
+def read_part(date, name, columns, rows=None):
+
+	# The given columns of a part, for just the rows given (or all of them)
+	directory = os.path.join(ARCHIVE_DIR, date, name)
+	values = {}
+
+	for column in columns:
+		data = np.load(os.path.join(directory, column + ".npy"), mmap_mode="r")
+		values[column] = np.array(data if rows is None else data[rows])
+
+	return values
+
+######################################################################
+
+def candidate_rows(date, name, bbox, min_wind):
+
+	# Row numbers in a part that might match, going by its cell index
+	directory = os.path.join(ARCHIVE_DIR, date, name)
+
+	cells = np.load(os.path.join(directory, "cells.npy"))
+	starts = np.load(os.path.join(directory, "starts.npy"))
+	wanted = np.ones(len(cells), dtype=bool)
+
+	if (bbox):
+		wanted &= cells_inside(cells, bbox)
+
+	if (min_wind is not None):
+		wanted &= np.load(os.path.join(directory, "cell_max_wind.npy")) >= min_wind
+
+	# Every row from the start of each wanted cell to the start of the next
+	first = starts[:-1][wanted]
+	counts = (starts[1:] - starts[:-1])[wanted]
+
+	return np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+######################################################################
+
+def part_could_match(entry, bbox, start, end, min_wind, min_head_tail, max_head_tail):
+
+	if (start is not None and entry["end"] < start):
+		return False
+	if (end is not None and entry["start"] >= end):
+		return False
+	if (min_wind is not None and entry["max_wind"] < min_wind):
+		return False
+	if (min_head_tail is not None and entry["max_head_tail"] < min_head_tail):
+		return False
+	if (max_head_tail is not None and entry["min_head_tail"] > max_head_tail):
+		return False
+
+	if (bbox):
+		(minlat, maxlat, minlon, maxlon) = bbox
+
+		if (entry["maxlat"] < minlat or entry["minlat"] > maxlat):
+			return False
+
+		# A box that crosses 180° is checked by the cells instead
+		if (minlon <= maxlon and (entry["maxlon"] < minlon or entry["minlon"] > maxlon)):
+			return False
+
+	return True
+
+######################################################################
+
+def partitions(start=None, end=None):
+
+	# Dates in the archive that overlap the time window (seconds since 1970)
+	if (not os.path.isdir(ARCHIVE_DIR)):
+		return []
+
+	dates = sorted(d for d in os.listdir(ARCHIVE_DIR) if os.path.isfile(os.path.join(ARCHIVE_DIR, d, "index.json")))
+
+	# A flight can carry on past midnight, so look back a day from the start
+	if (start is not None):
+		first = (datetime.datetime.fromtimestamp(start, datetime.timezone.utc).date() - datetime.timedelta(days=1)).isoformat()
+		dates = [d for d in dates if d >= first]
+
+	if (end is not None):
+		last = datetime.datetime.fromtimestamp(end, datetime.timezone.utc).date().isoformat()
+		dates = [d for d in dates if d <= last]
+
+	return dates
+
+######################################################################
+
+def query(bbox=None, start=None, end=None, min_wind=None, min_head_tail=None, max_head_tail=None, columns=None):
+
+	# Every archived segment inside bbox (minlat, maxlat, minlon, maxlon), in
+	# the time window [start, end) (seconds since 1970), with at least
+	# min_wind of wind and head/tail wind between min_head_tail and
+	# max_head_tail (metres per second). Any of them can be None. Returns a
+	# dict of arrays, with the flight and the given columns (default: all)
+	columns = list(dict.fromkeys(["flight"] + (columns or COLUMNS)))
+	needed = list(dict.fromkeys(columns + ["time", "latitude", "longitude", "wind", "head_tail"]))
+
+	results = {column: [] for column in columns}
+
+	for date in partitions(start, end):
+		for (name, entry) in load_index(date).items():
+
+			if (not part_could_match(entry, bbox, start, end, min_wind, min_head_tail, max_head_tail)):
+				profiling.count("parts_skipped")
+				continue
+
+			with profiling.span("read"):
+				rows = candidate_rows(date, name, bbox, min_wind)
+				if (len(rows) == 0):
+					continue
+
+				values = read_part(date, name, needed, rows)
+
+			profiling.count("rows_read", len(rows))
+
+			# The cells only narrow it down, so check each row properly
+			keep = np.ones(len(rows), dtype=bool)
+
+			if (bbox):
+				(minlat, maxlat, minlon, maxlon) = bbox
+				keep &= (values["latitude"] >= minlat) & (values["latitude"] <= maxlat)
+				keep &= longitude_inside(values["longitude"], minlon, maxlon)
+
+			if (start is not None):
+				keep &= values["time"] >= start
+			if (end is not None):
+				keep &= values["time"] < end
+			if (min_wind is not None):
+				keep &= values["wind"] >= min_wind
+			if (min_head_tail is not None):
+				keep &= values["head_tail"] >= min_head_tail
+			if (max_head_tail is not None):
+				keep &= values["head_tail"] <= max_head_tail
+
+			for column in columns:
+				results[column].append(values[column][keep])
+
+	return {column: np.concatenate(arrays) if arrays else np.array([]) for (column, arrays) in results.items()}
+
+######################################################################
+
+def compact(date):
+
+	# Merges all of a date's parts into one, sorted by cell
+	index = load_index(date)
+
+	if (len(index) < 2):
+		return
+
+	parts = [read_part(date, name, COLUMNS + ["flight"]) for name in index]
+	columns = {column: np.concatenate([part[column] for part in parts]) for column in COLUMNS + ["flight"]}
+
+	entry = write_part(date, "compacted.tmp_part", columns)
+
+	for name in index:
+		shutil.rmtree(os.path.join(ARCHIVE_DIR, date, name))
+
+	os.replace(os.path.join(ARCHIVE_DIR, date, "compacted.tmp_part"), os.path.join(ARCHIVE_DIR, date, "compacted"))
+	save_index(date, {"compacted": entry})
+
+######################################################################
+
+def ingest(kmlfiles, speed=250, level=250, log=sys.stderr):
+
+	# Analyses FR24 KML files just for the archive
+	import analyse_flight # type: ignore
+
+	for kmlfile in kmlfiles:
+		print(kmlfile, file=log)
+		analyse_flight.analyse(kmlfile, io.StringIO(), speed, level, out=io.StringIO(), log=io.StringIO(), archive=append)
+
+######################################################################
+
+def parse_time(text, end=False):
+
+	# YYYY-MM-DD or an ISO date and time (UTC unless it says otherwise). A
+	# bare end date means the end of that day
+	when = datetime.datetime.fromisoformat(text)
+
+	if (when.tzinfo is None):
+		when = when.replace(tzinfo=datetime.timezone.utc)
+
+	if (end and len(text) == 10):
+		when += datetime.timedelta(days=1)
+
+	return when.timestamp()
+
+######################################################################
+
+def write_segments(results, factor, units, fp):
+
+	writer = csv.writer(fp)
+	writer.writerow(["flight", "time", "latitude", "longitude", "altitude", "wind", "wind_azimuth", "heading", "head_tail", "ground_speed", "units"])
+
+	for idx in np.argsort(results["time"], kind="stable"):
+		when = datetime.datetime.fromtimestamp(results["time"][idx], datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+
+		writer.writerow([results["flight"][idx], when, f"{results['latitude'][idx]:.6f}", f"{results['longitude'][idx]:.6f}",
+			f"{results['altitude'][idx]:.0f}", f"{results['wind'][idx] * factor:.2f}", f"{results['wind_azimuth'][idx]:.0f}",
+			f"{results['heading'][idx]:.0f}", f"{results['head_tail'][idx] * factor:.2f}", f"{results['ground_speed'][idx] * factor:.2f}", units])
+
+######################################################################
+
+def write_flights(results, factor, units, fp):
+
+	# One row per flight: when it first matched, how many segments did, and
+	# the strongest wind among them
+	writer = csv.writer(fp)
+	writer.writerow(["flight", "first_match", "segments", "max_wind", "units"])
+
+	(flights, inverse, counts) = np.unique(results["flight"], return_inverse=True, return_counts=True)
+
+	first = np.full(len(flights), np.inf)
+	np.minimum.at(first, inverse, results["time"])
+
+	strongest = np.zeros(len(flights))
+	np.maximum.at(strongest, inverse, results["wind"])
+
+	for idx in np.argsort(first, kind="stable"):
+		when = datetime.datetime.fromtimestamp(first[idx], datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+		writer.writerow([flights[idx], when, counts[idx], f"{strongest[idx] * factor:.2f}", units])
+
+######################################################################
+
+def main():
+
+	# Command line arguments
+	parser = argparse.ArgumentParser(
+				prog='Flight archive',
+				description='Stores and queries the per-segment results of analysed flights')
+
+	subparsers = parser.add_subparsers(dest="command", required=True)
+
+	ingest_parser = subparsers.add_parser("ingest", help="Analyses FlightRadar24 KML files into the archive")
+	ingest_parser.add_argument("kmlfile", nargs="+")
+	ingest_parser.add_argument("-s", "--speed", type=float, help="metres per second", default=250)
+	ingest_parser.add_argument("--level", type=int, choices=[300, 250, 200, 150, 50], default=250)
+	profiling.add_argument(ingest_parser)
+
+	query_parser = subparsers.add_parser("query", help="Finds archived segments")
+	query_parser.add_argument('--minlat', type=float, default=-90)
+	query_parser.add_argument('--maxlat', type=float, default=90)
+	query_parser.add_argument('--minlon', type=float, default=-180, help="-180 to 180 (more than --maxlon to cross 180°)")
+	query_parser.add_argument('--maxlon', type=float, default=180)
+	query_parser.add_argument('--start', help="YYYY-MM-DD or ISO date and time")
+	query_parser.add_argument('--end', help="YYYY-MM-DD (inclusive) or ISO date and time")
+	query_parser.add_argument('--min-wind', type=float, help="in --units")
+	query_parser.add_argument('--min-head-tail', type=float, help="in --units (negative for a headwind)")
+	query_parser.add_argument('--max-head-tail', type=float, help="in --units")
+	query_parser.add_argument("--units", choices=list(UNITS), default='mps')
+	query_parser.add_argument('--flights', action="store_true", default=False, help="One row per flight instead of per segment")
+	query_parser.add_argument("--out") # Write to a named CSV file
+	profiling.add_argument(query_parser)
+
+	compact_parser = subparsers.add_parser("compact", help="Merges each date's parts into one")
+	compact_parser.add_argument('--date', action="append", help="YYYY-MM-DD (can be repeated, default: every date)")
+	profiling.add_argument(compact_parser)
+
+	args = parser.parse_args()
+
+	if (args.profile):
+		profiling.start(args.profile)
+
+	if (args.command == "ingest"):
+		ingest(args.kmlfile, args.speed, args.level)
+
+	elif (args.command == "compact"):
+		for date in (args.date or partitions()):
+			with profiling.span("compact"):
+				compact(date)
+
+	else:
+		factor = UNITS[args.units]
+
+		bbox = None
+		if ((args.minlat, args.maxlat, args.minlon, args.maxlon) != (-90, 90, -180, 180)):
+			bbox = (args.minlat, args.maxlat, args.minlon, args.maxlon)
+
+		def to_mps(value):
+			return None if value is None else value / factor
+
+		results = query(bbox,
+			parse_time(args.start) if args.start else None,
+			parse_time(args.end, end=True) if args.end else None,
+			to_mps(args.min_wind), to_mps(args.min_head_tail), to_mps(args.max_head_tail))
+
+		# Output file
+		if (args.out):
+			fp = open(args.out, "w", newline="")
+		else:
+			fp = sys.stdout
+
+		if (args.flights):
+			write_flights(results, factor, args.units, fp)
+		else:
+			write_segments(results, factor, args.units, fp)
+
+		if (args.out):
+			fp.close()
+
+######################################################################
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,173 @@
+# Flight time predictions
+#  How long would a fixed route have taken on each of the last N days?
+#
+# Each route's geodesic is sampled once, and the u/v grids for every date are
+# stacked into one (dates, lat, lon) array, so every (route, date) flight time
+# comes out of a single numpy pass using the same airspeed + head/tail model
+# as analyse_flight.py.
+import argparse
+import csv
+import datetime
+import math
+import sys
+import numpy as np
+import grib_downloader # type: ignore
+import route_distance # type: ignore
+import wind_route # type: ignore
+
+SEGMENT_LENGTH = 50000 # metres between wind samples along each route
+
+######################################################################
+
+def last_n_days(end, days):
+
+	# The "days" dates up to and including "end", oldest first, as YYYY-MM-DD
+	end = datetime.date.fromisoformat(end)
+
+	return [(end - datetime.timedelta(days=n)).isoformat() for n in range(days - 1, -1, -1)]
+
+######################################################################
+
+def stack_winds(dates, level):
+
+	# One (dates, lat, lon) array each for u and v. All the dates must be on
+	# the same grid, which they are when they all come from grib_downloader
+	u_grids = []
+	v_grids = []
+
+	for date in dates:
+		ds = grib_downloader.get_dataset(date, level)
+		u_grids.append(ds.u.values.astype(np.float64))
+		v_grids.append(ds.v.values.astype(np.float64))
+
+	return {
+		"latitude": ds.latitude.values.astype(np.float64),
+		"longitude": ds.longitude.values.astype(np.float64),
+		"u": np.stack(u_grids),
+		"v": np.stack(v_grids)
+	}
+
+######################################################################
+
+def sample_routes(routes, wind):
+
+	# Chop every route's geodesic into segments, once. Returns the length,
+	# azimuth and nearest wind cell of every segment, plus where each route's
+	# segments start in those arrays
+	dists = []
+	azimuths = []
+	starts = []
+	lat_idxs = []
+	lon_idxs = []
+	offset = 0
+
+	for (lat1, lon1, lat2, lon2) in routes:
+		(az12, az21, dist) = route_distance.get_geod().inv(lon1, lat1, lon2, lat2)
+		(lats, lons) = route_distance.globe_track(lat1, lon1, lat2, lon2, max(math.ceil(dist / SEGMENT_LENGTH), 1))
+
+		(az12, az21, dist) = route_distance.get_geod().inv(lons[:-1], lats[:-1], lons[1:], lats[1:])
+		(lat_idx, lon_idx) = wind_route.nearest_indices(wind, lats[:-1], lons[:-1])
+
+		starts.append(offset)
+		offset += len(lat_idx)
+
+		dists.append(np.asarray(dist))
+		azimuths.append(np.asarray(az12))
+		lat_idxs.append(lat_idx)
+		lon_idxs.append(lon_idx)
+
+	return {
+		"dist": np.concatenate(dists),
+		"azimuth": np.concatenate(azimuths),
+		"lat_idx": np.concatenate(lat_idxs),
+		"lon_idx": np.concatenate(lon_idxs),
+		"starts": np.array(starts)
+	}
+
+######################################################################
+
+def predict_times(segments, wind, speed):
+
+	# Flight time in seconds for every (route, date), as a (routes, dates)
+	# array. As in wind_route.py, a headwind stronger than the airspeed can't
+	# be flown through, so that route takes forever (inf) on that date
+	u_vals = wind["u"][:, segments["lat_idx"], segments["lon_idx"]]
+	v_vals = wind["v"][:, segments["lat_idx"], segments["lon_idx"]]
+
+	gs = wind_route.ground_speeds(u_vals, v_vals, segments["azimuth"], speed)
+
+	# Add up each route's segments, for every date at once
+	with np.errstate(divide="ignore"):
+		segment_times = np.where(gs > 0, segments["dist"] / gs, np.inf)
+	times = np.add.reduceat(segment_times, segments["starts"], axis=1)
+
+	return times.T
+
+######################################################################
+
+def day_count(text):
+
+	# argparse type for --days: there has to be at least one date to stack
+	days = int(text)
+
+	if (days < 1):
+		raise argparse.ArgumentTypeError("must be at least 1")
+
+	return days
+
+######################################################################
+
+def main():
+
+	# Command line arguments
+	parser = argparse.ArgumentParser(
+				prog='Flight times',
+				description='Predicts the flight time of routes over a range of dates')
+
+	# Each route is orig:dest, where orig and dest are airport names (see
+	# airports.py) or lat,lon. As with route_distance.py, a southern
+	# coordinate can't be separated from its switch by a space
+	parser.add_argument('-r', '--route', action="append", required=True, help="e.g. -r sydney:santiago or -r-30,100:perth")
+	parser.add_argument('--end', default=(datetime.date.today() - datetime.timedelta(days=1)).isoformat(), help="YYYY-MM-DD, last date (default: yesterday)")
+	parser.add_argument('--days', type=day_count, default=30, help="Number of days up to --end")
+	parser.add_argument("--level", type=int, choices=[300, 250, 200, 150, 100, 50], default=250, help="hPa")
+	parser.add_argument("-s", "--speed", type=wind_route.airspeed, help="metres per second", default=250) # speed in m/s (250 m/s = 900 km/h = 559 mph)
+	parser.add_argument("--out") # Write to a named CSV file
+
+	args = parser.parse_args()
+
+	names = [route.split(":") for route in args.route]
+	routes = [route_distance.parse_location(orig) + route_distance.parse_location(dest) for (orig, dest) in names]
+
+	dates = last_n_days(args.end, args.days)
+	wind = stack_winds(dates, args.level)
+
+	segments = sample_routes(routes, wind)
+	times = predict_times(segments, wind, args.speed)
+
+	# Output file
+	if (args.out):
+		fp = open(args.out, "w", newline="")
+	else:
+		fp = sys.stdout
+
+	writer = csv.writer(fp)
+	writer.writerow(["orig", "dest", "date", "seconds", "flight_time"])
+
+	for (route_idx, (orig, dest)) in enumerate(names):
+		for (date_idx, date) in enumerate(dates):
+			seconds = times[route_idx, date_idx]
+
+			if (math.isinf(seconds)):
+				print(f"{orig}:{dest} on {date}: the headwind is stronger than {args.speed} m/s somewhere along the route", file=sys.stderr)
+				writer.writerow([orig, dest, date, "", "impassable"])
+			else:
+				writer.writerow([orig, dest, date, f"{seconds:.0f}", wind_route.format_time(seconds)])
+
+	if (args.out):
+		fp.close()
+
+######################################################################
+
+if __name__ == "__main__":
+	main()
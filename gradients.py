@@ -0,0 +1,100 @@
+# Colour ramps
+#  The colour maps analyse_flight.py and grib_to_placemarks.py used to build
+# with matplotlib's LinearSegmentedColormap.from_list(), baked into 256 entry
+# lookup tables of Google Earth colours (aabbggrr). Looking a value up here
+# gives exactly the same colour as cmap(value) followed by rgba_to_GE_hex(),
+# without the cost of importing matplotlib.
+
+# Head/tail wind: red, orange, white, blue, green
+WIND_IMPACT = [
+	"FF3f3fff", "FF3e41ff", "FF3d43ff", "FF3c46ff", "FF3b48ff", "FF3a4aff", "FF394cff", "FF384fff",
+	"FF3751ff", "FF3653ff", "FF3555ff", "FF3458ff", "FF335aff", "FF325cff", "FF315eff", "FF3061ff",
+	"FF2f63ff", "FF2e65ff", "FF2d68ff", "FF2c6aff", "FF2b6cff", "FF2a6eff", "FF2971ff", "FF2873ff",
+	"FF2775ff", "FF2677ff", "FF257aff", "FF247cff", "FF237eff", "FF2281ff", "FF2183ff", "FF2085ff",
+	"FF1f87ff", "FF1e8aff", "FF1d8cff", "FF1c8eff", "FF1b90ff", "FF1a93ff", "FF1995ff", "FF1897ff",
+	"FF1799ff", "FF169cff", "FF159eff", "FF14a0ff", "FF13a3ff", "FF12a5ff", "FF11a7ff", "FF10a9ff",
+	"FF0facff", "FF0eaeff", "FF0db0ff", "FF0cb2ff", "FF0bb5ff", "FF0ab7ff", "FF09b9ff", "FF08bbff",
+	"FF07beff", "FF06c0ff", "FF05c2ff", "FF04c5ff", "FF03c7ff", "FF02c9ff", "FF01cbff", "FF00ceff",
+	"FF01d0ff", "FF05d0ff", "FF09d1ff", "FF0dd2ff", "FF11d3ff", "FF15d3ff", "FF19d4ff", "FF1dd5ff",
+	"FF21d6ff", "FF25d6ff", "FF29d7ff", "FF2dd8ff", "FF31d9ff", "FF35d9ff", "FF39daff", "FF3ddbff",
+	"FF41dcff", "FF45dcff", "FF49ddff", "FF4ddeff", "FF51dfff", "FF55dfff", "FF59e0ff", "FF5de1ff",
+	"FF61e2ff", "FF65e2ff", "FF69e3ff", "FF6de4ff", "FF71e5ff", "FF75e5ff", "FF79e6ff", "FF7de7ff",
+	"FF81e8ff", "FF85e8ff", "FF89e9ff", "FF8deaff", "FF91ebff", "FF95ebff", "FF99ecff", "FF9dedff",
+	"FFa1eeff", "FFa5eeff", "FFa9efff", "FFadf0ff", "FFb1f1ff", "FFb5f2ff", "FFb9f2ff", "FFbdf3ff",
+	"FFc1f4ff", "FFc5f5ff", "FFc9f5ff", "FFcdf6ff", "FFd1f7ff", "FFd5f8ff", "FFd9f8ff", "FFddf9ff",
+	"FFe1faff", "FFe5fbff", "FFe9fbff", "FFedfcff", "FFf1fdff", "FFf5feff", "FFf9feff", "FFfdffff",
+	"FFfffefd", "FFfffbf9", "FFfff8f5", "FFfff5f1", "FFfff2ed", "FFffefe9", "FFffece5", "FFffe9e1",
+	"FFffe6dd", "FFffe3d9", "FFffe0d5", "FFffddd1", "FFffdacd", "FFffd7c9", "FFffd4c5", "FFffd1c1",
+	"FFffcebd", "FFffcbb9", "FFffc8b5", "FFffc5b1", "FFffc2ad", "FFffbea9", "FFffbba5", "FFffb8a1",
+	"FFffb59d", "FFffb299", "FFffaf95", "FFffac91", "FFffa98d", "FFffa689", "FFffa385", "FFffa081",
+	"FFff9d7d", "FFff9a79", "FFff9775", "FFff9471", "FFff916d", "FFff8e69", "FFff8b65", "FFff8861",
+	"FFff855d", "FFff8259", "FFff7f55", "FFff7c51", "FFff794d", "FFff7649", "FFff7345", "FFff7041",
+	"FFff6d3d", "FFff6a39", "FFff6735", "FFff6431", "FFff612d", "FFff5e29", "FFff5b25", "FFff5821",
+	"FFff551d", "FFff5219", "FFff4f15", "FFff4c11", "FFff490d", "FFff4609", "FFff4305", "FFff4001",
+	"FFfd4100", "FFfa4401", "FFf74702", "FFf44a03", "FFf14d04", "FFee5005", "FFeb5306", "FFe85607",
+	"FFe55908", "FFe25c09", "FFdf5f0a", "FFdc620b", "FFd9650c", "FFd6680d", "FFd36b0e", "FFd06e0f",
+	"FFcd7110", "FFca7411", "FFc77712", "FFc47a13", "FFc17d14", "FFbe8115", "FFbb8416", "FFb88717",
+	"FFb58a18", "FFb28d19", "FFaf901a", "FFac931b", "FFa9961c", "FFa6991d", "FFa39c1e", "FFa09f1f",
+	"FF9ca220", "FF99a521", "FF96a822", "FF93ab23", "FF90ae24", "FF8db125", "FF8ab426", "FF87b727",
+	"FF84ba28", "FF81bd29", "FF7ec02a", "FF7bc32b", "FF78c62c", "FF75c92d", "FF72cc2e", "FF6fcf2f",
+	"FF6cd230", "FF69d531", "FF66d832", "FF63db33", "FF60de34", "FF5de135", "FF5ae436", "FF57e737",
+	"FF54ea38", "FF51ed39", "FF4ef03a", "FF4bf33b", "FF48f63c", "FF45f93d", "FF42fc3e", "FF3fff3f"
+]
+
+# Wind speed: from #04091B at 0 up to #FFFFFF at 1
+WIND_SPEED = [
+	"FF1b0904", "FF201003", "FF251703", "FF2b1e03", "FF302603", "FF362d03", "FF3b3403", "FF403c02",
+	"FF464302", "FF4b4a02", "FF515102", "FF565902", "FF5b6002", "FF616701", "FF666f01", "FF6c7601",
+	"FF717d01", "FF768401", "FF7c8c01", "FF819301", "FF869a00", "FF8ca100", "FF91a900", "FF97b000",
+	"FF9cb700", "FFa1bf00", "FFa1c300", "FF9ac602", "FF94c804", "FF8eca05", "FF87cc07", "FF81cf09",
+	"FF7ad10b", "FF74d30c", "FF6dd50e", "FF67d810", "FF60da11", "FF5adc13", "FF53de15", "FF4de116",
+	"FF47e318", "FF40e51a", "FF3ae71b", "FF33ea1d", "FF2dec1f", "FF26ee21", "FF20f022", "FF19f324",
+	"FF13f526", "FF0cf727", "FF06f929", "FF00fb2b", "FF00f732", "FF00f239", "FF00ed40", "FF00e847",
+	"FF00e34e", "FF00de55", "FF00d95c", "FF00d463", "FF00cf6a", "FF00ca71", "FF00c578", "FF00c07f",
+	"FF00bc86", "FF00b78d", "FF00b294", "FF00ad9b", "FF00a8a2", "FF00a3a9", "FF009eb0", "FF0099b7",
+	"FF0094be", "FF008fc5", "FF008acc", "FF0085d3", "FF0080da", "FF017cde", "FF0577de", "FF0872df",
+	"FF0b6de0", "FF0f68e1", "FF1263e1", "FF155ee2", "FF1959e3", "FF1c54e4", "FF1f4fe4", "FF234ae5",
+	"FF2645e6", "FF2940e7", "FF2d3be7", "FF3036e8", "FF3331e9", "FF372cea", "FF3a27ea", "FF3d22eb",
+	"FF411dec", "FF4418ed", "FF4713ed", "FF4b0eee", "FF4e09ef", "FF5104f0", "FF5500f0", "FF5900ee",
+	"FF5d01ec", "FF6102ea", "FF6503e8", "FF6904e6", "FF6d04e4", "FF7105e2", "FF7506df", "FF7907dd",
+	"FF7d08db", "FF8109d9", "FF8509d7", "FF890ad5", "FF8d0bd3", "FF900cd1", "FF940dce", "FF980ecc",
+	"FF9c0eca", "FFa00fc8", "FFa410c6", "FFa811c4", "FFac12c2", "FFb013c0", "FFb413bd", "FFb814bb",
+	"FFbb16bb", "FFbb17bb", "FFbc19bc", "FFbc1bbc", "FFbd1dbd", "FFbd1fbd", "FFbe21be", "FFbe23be",
+	"FFbf25bf", "FFbf27bf", "FFc029c0", "FFc12bc1", "FFc12dc1", "FFc22fc2", "FFc231c2", "FFc332c3",
+	"FFc334c3", "FFc436c4", "FFc438c4", "FFc53ac5", "FFc63cc6", "FFc63ec6", "FFc740c7", "FFc742c7",
+	"FFc844c8", "FFc846c8", "FFc948c9", "FFc949c9", "FFca4bca", "FFca4dca", "FFcb4fcb", "FFcc51cc",
+	"FFcc52cc", "FFcd54cd", "FFcd56cd", "FFce58ce", "FFce5ace", "FFcf5ccf", "FFcf5dcf", "FFd05fd0",
+	"FFd161d1", "FFd163d1", "FFd265d2", "FFd266d2", "FFd368d3", "FFd36ad3", "FFd46cd4", "FFd46ed4",
+	"FFd56fd5", "FFd671d6", "FFd673d6", "FFd775d7", "FFd777d7", "FFd879d8", "FFd87bd8", "FFd97cd9",
+	"FFd97ed9", "FFda80da", "FFda82da", "FFdb84db", "FFdc86dc", "FFdc88dc", "FFdd8add", "FFdd8cdd",
+	"FFde8dde", "FFde8fde", "FFdf91df", "FFdf93df", "FFe095e0", "FFe197e1", "FFe199e1", "FFe29be2",
+	"FFe29de2", "FFe39ee3", "FFe3a0e3", "FFe4a2e4", "FFe4a4e4", "FFe5a6e5", "FFe5a8e5", "FFe6a9e6",
+	"FFe6abe6", "FFe7ade7", "FFe7afe7", "FFe8b1e8", "FFe8b2e8", "FFe9b4e9", "FFeab6ea", "FFeab8ea",
+	"FFebb9eb", "FFebbbeb", "FFecbdec", "FFecbfec", "FFedc0ed", "FFedc2ed", "FFeec4ee", "FFeec6ee",
+	"FFefc8ef", "FFefc9ef", "FFf0cbf0", "FFf0cdf0", "FFf1cff1", "FFf1d0f1", "FFf2d2f2", "FFf2d4f2",
+	"FFf3d6f3", "FFf3d8f3", "FFf4d9f4", "FFf4dbf4", "FFf5ddf5", "FFf6dff6", "FFf6e1f6", "FFf7e3f7",
+	"FFf7e4f7", "FFf8e6f8", "FFf8e8f8", "FFf9eaf9", "FFf9ecf9", "FFfaedfa", "FFfbeffb", "FFfbf1fb",
+	"FFfcf3fc", "FFfcf5fc", "FFfdf6fd", "FFfdf8fd", "FFfefafe", "FFfefcfe", "FFfffeff", "FFffffff"
+]
+
+# What matplotlib gives for NaN (transparent black, but Google Earth gets FF alpha)
+BAD_COLOUR = "FF000000"
+
+######################################################################
+
+def ge_colour(ramp, value):
+
+	# value runs from 0 to 1 along the ramp. Anything outside that range
+	# gets the colour at the nearest end, like matplotlib does
+	if (value != value): # NaN
+		return BAD_COLOUR
+
+	idx = value * len(ramp)
+
+	if (idx < 0):
+		return ramp[0]
+
+	if (idx >= len(ramp)):
+		return ramp[-1]
+
+	return ramp[int(idx)]
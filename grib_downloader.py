@@ -1,15 +1,18 @@
 # GRIB downloader
 #  Takes the date as an argument, and checks to see if data exists for that date
 # If not, it downloads it. Returns a GRIB dataset object
-import cfgrib # type: ignore
-import urllib.request
 import urllib.parse
-import xarray # type: ignore
 import os
+import threading
+import profiling # type: ignore
 
 # This is where we store the files for each date
 DATA_DIR = "data/"
 
+# cfgrib isn't thread safe, so the servers (which download several dates at
+# once) still only decode one file at a time
+decode_lock = threading.Lock()
+
 ######################################################################
 
 def construct_url(date, level):
@@ -51,13 +54,30 @@ def get_dataset(date, level):
 	filename = DATA_DIR + date + "_" + str(level) + ".grib"
 
 	if (not os.path.isfile(filename)):
+		# Only the download needs urllib.request, which is slow to import
+		import urllib.request
+
 		url = construct_url(date, level)
 		try:
-			urllib.request.urlretrieve(url, filename)
+			with profiling.span("download"):
+				urllib.request.urlretrieve(url, filename)
+			profiling.count("grib_downloads")
 		except Exception as e:
 			print(e, date, level)
 			quit()
 
-	return cfgrib.open_dataset(filename)
+	# cfgrib (and xarray with it) takes a while to import, so only do it
+	# once we actually have a file to open
+	with profiling.span("import_cfgrib"):
+		import cfgrib # type: ignore
+
+	# open_dataset() only reads the GRIB index; the values aren't decoded
+	# until something asks for them, so load them here where they're timed
+	with profiling.span("decode"), decode_lock:
+		ds = cfgrib.open_dataset(filename).load()
+
+	profiling.count("grib_decodes")
+
+	return ds
 
 ################################################################################
@@ -1,91 +1,73 @@
 import xml.etree.ElementTree as ET 
 import zipfile
 import argparse
+import concurrent.futures
+import datetime
+import os
 import sys
 import math
-import numpy as np
 import grib_downloader # type: ignore
-import matplotlib as mpl # type: ignore
-import progress.bar # type: ignore
+import gradients # type: ignore
+import profiling # type: ignore
+
+# numpy takes a while to import, so it's imported by the functions that use
+# it rather than here, and --help doesn't have to wait for it
 
 # NetworkLinks
 links = [
-	{ "minlat": -90, "maxlat": -75, "minlon": 0, "maxlon": 360, "d": [] },
-
-	{ "minlat": -75, "maxlat": -45, "minlon": 0, "maxlon": 90, "d": [] },
-	{ "minlat": -75, "maxlat": -45, "minlon": 90, "maxlon": 180, "d": [] },
-	{ "minlat": -75, "maxlat": -45, "minlon": 180, "maxlon": 270, "d": [] },
-	{ "minlat": -75, "maxlat": -45, "minlon": 270, "maxlon": 360, "d": [] },
-
-	{ "minlat": -45, "maxlat": -15, "minlon": 0, "maxlon": 90, "d": [] },
-	{ "minlat": -45, "maxlat": -15, "minlon": 90, "maxlon": 180, "d": [] },
-	{ "minlat": -45, "maxlat": -15, "minlon": 180, "maxlon": 270, "d": [] },
-	{ "minlat": -45, "maxlat": -15, "minlon": 270, "maxlon": 360, "d": [] },
-
-	{ "minlat": -15, "maxlat": 15, "minlon": 0, "maxlon": 90, "d": [] },
-	{ "minlat": -15, "maxlat": 15, "minlon": 90, "maxlon": 180, "d": [] },
-	{ "minlat": -15, "maxlat": 15, "minlon": 180, "maxlon": 270, "d": [] },
-	{ "minlat": -15, "maxlat": 15, "minlon": 270, "maxlon": 360, "d": [] },
-
-	{ "minlat": 15, "maxlat": 45, "minlon": 0, "maxlon": 90, "d": [] },
-	{ "minlat": 15, "maxlat": 45, "minlon": 90, "maxlon": 180, "d": [] },
-	{ "minlat": 15, "maxlat": 45, "minlon": 180, "maxlon": 270, "d": [] },
-	{ "minlat": 15, "maxlat": 45, "minlon": 270, "maxlon": 360, "d": [] },
-
-	{ "minlat": 45, "maxlat": 75, "minlon": 0, "maxlon": 90, "d": [] },
-	{ "minlat": 45, "maxlat": 75, "minlon": 90, "maxlon": 180, "d": [] },
-	{ "minlat": 45, "maxlat": 75, "minlon": 180, "maxlon": 270, "d": [] },
-	{ "minlat": 45, "maxlat": 75, "minlon": 270, "maxlon": 360, "d": [] },
-
-	{ "minlat": 75, "maxlat": 90, "minlon": 0, "maxlon": 360, "d": [] }
+	{ "minlat": -90, "maxlat": -75, "minlon": 0, "maxlon": 360 },
+
+	{ "minlat": -75, "maxlat": -45, "minlon": 0, "maxlon": 90 },
+	{ "minlat": -75, "maxlat": -45, "minlon": 90, "maxlon": 180 },
+	{ "minlat": -75, "maxlat": -45, "minlon": 180, "maxlon": 270 },
+	{ "minlat": -75, "maxlat": -45, "minlon": 270, "maxlon": 360 },
+
+	{ "minlat": -45, "maxlat": -15, "minlon": 0, "maxlon": 90 },
+	{ "minlat": -45, "maxlat": -15, "minlon": 90, "maxlon": 180 },
+	{ "minlat": -45, "maxlat": -15, "minlon": 180, "maxlon": 270 },
+	{ "minlat": -45, "maxlat": -15, "minlon": 270, "maxlon": 360 },
+
+	{ "minlat": -15, "maxlat": 15, "minlon": 0, "maxlon": 90 },
+	{ "minlat": -15, "maxlat": 15, "minlon": 90, "maxlon": 180 },
+	{ "minlat": -15, "maxlat": 15, "minlon": 180, "maxlon": 270 },
+	{ "minlat": -15, "maxlat": 15, "minlon": 270, "maxlon": 360 },
+
+	{ "minlat": 15, "maxlat": 45, "minlon": 0, "maxlon": 90 },
+	{ "minlat": 15, "maxlat": 45, "minlon": 90, "maxlon": 180 },
+	{ "minlat": 15, "maxlat": 45, "minlon": 180, "maxlon": 270 },
+	{ "minlat": 15, "maxlat": 45, "minlon": 270, "maxlon": 360 },
+
+	{ "minlat": 45, "maxlat": 75, "minlon": 0, "maxlon": 90 },
+	{ "minlat": 45, "maxlat": 75, "minlon": 90, "maxlon": 180 },
+	{ "minlat": 45, "maxlat": 75, "minlon": 180, "maxlon": 270 },
+	{ "minlat": 45, "maxlat": 75, "minlon": 270, "maxlon": 360 },
+
+	{ "minlat": 75, "maxlat": 90, "minlon": 0, "maxlon": 360 }
 ]
 
-# Command line arguments
-parser = argparse.ArgumentParser(
-            prog='Convert GRIB data to KML PlaceMark file')
-
-parser.add_argument('--date', required=True, help="YYYY-MM-DD") # Date of the GRIB file
-parser.add_argument('--out', required=True, help="KML output file name") # Filename of the output file
-parser.add_argument("--units", choices=['mph', 'kmh', 'mps'], default='mps')
-
-args = parser.parse_args()
-
-# Initialise the colour map
-cmap = mpl.colors.LinearSegmentedColormap.from_list("cmap", [
-		"#04091B", # 0
-		"#00C2A4", "#2BFB00", # 100, 200
-		"#DD7E00", "#F00055", # 300, 400
-		"#BA15BA", "#C846C8", # 500, 600
-		"#D674D6", "#E4A4E4", # 700, 800
-		"#F1D1F1", "#FFFFFF" # 900, 1000
-	])
-
 # KML Namespace
 kml_ns = {'kml' : 'http://www.opengis.net/kml/2.2'}
 
 ######################################################################
 
-def link_map(links):
+def kml_header(name, styles=True):
 
-	arr = np.zeros((180, 360), dtype=np.int8)
+	header = f"""<?xml version="1.0" encoding="UTF-8"?>
+	<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2" xmlns:kml="http://www.opengis.net/kml/2.2" xmlns:atom="http://www.w3.org/2005/Atom">
+	<Document>
+		<name>{name}</name>
+		<open>1</open>"""
 
-	for idx in range(len(links)):
-		nw_link = links[idx]
-		for lat_idx in range(nw_link["minlat"], nw_link["maxlat"]):
-			for lon_idx in range(nw_link["minlon"], nw_link["maxlon"]):
-				arr[lat_idx, lon_idx] = idx
+	if (styles):
+		header += kml_styles()
 
-	return arr
+	return header
 
 ######################################################################
 
-def kml_header(name):
+def kml_styles():
 
-	return f"""<?xml version="1.0" encoding="UTF-8"?>
-	<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2" xmlns:kml="http://www.opengis.net/kml/2.2" xmlns:atom="http://www.w3.org/2005/Atom">
-	<Document>
-		<name>{name}</name>
-		<open>1</open>
+	return f"""
 		<StyleMap id="m_arrow">
 			<Pair>
 				<key>normal</key>
@@ -131,38 +113,27 @@ def kml_footer():
 
 ######################################################################
 
-def rgba_to_GE_hex(rgba):
-
-	r = min(int(rgba[0] * 256), 255)
-	g = min(int(rgba[1] * 256), 255)
-	b = min(int(rgba[2] * 256), 255)
-
-	return f"FF{b:02x}{g:02x}{r:02x}"
-
-######################################################################
-
-def create_placemark(lat, lon, magnitude, azimuth):
+def create_placemark(lat, lon, magnitude, azimuth, units="mps", style_url="#m_arrow", timespan=""):
 
 	# Normalise the longitude for Google Earth
 	if (lon > 180):
 		lon = lon - 360
 
-	if (args.units == "mph"):
+	if (units == "mph"):
 		name = f"{(magnitude * 2.23694):.2f} mph at {azimuth:.0f}°"
-	elif (args.units == "kmh"):
+	elif (units == "kmh"):
 		name = f"{(magnitude * 3.6):.2f} kmh at {azimuth:.0f}°"
 	else: # Metres per second
 		name = f"{magnitude:.2f} m/s at {azimuth:.0f}°"
 	
 	# Cap the magnitude at 100
 	flt = min(magnitude, 100) / 100
-	rgba = cmap(flt)
-	ge_color = rgba_to_GE_hex(rgba)
+	ge_color = gradients.ge_colour(gradients.WIND_SPEED, flt)
 
 	return f"""
 	<Placemark>
-	   	<name>{name}</name>
-		<styleUrl>#m_arrow</styleUrl>
+	   	<name>{name}</name>{timespan}
+		<styleUrl>{style_url}</styleUrl>
 		<Style>
 			<IconStyle>
 				<heading>{azimuth:.0f}</heading>
@@ -188,49 +159,63 @@ def calculate_azimuth(u_val, v_val):
 
 ######################################################################
 
-# Create an array with the lookup value for each NetworkLink
-link = link_map(links)
+def calculate_azimuths(u_vals, v_vals):
+
+	# Same as calculate_azimuth(), but for whole numpy arrays at once
+	import numpy as np
 
-ds = grib_downloader.get_dataset(args.date)
-arr = ds.to_array()
+	azi = 90 - np.trunc(np.arctan2(v_vals, u_vals) * 180 / math.pi).astype(int)
 
-max_values = len(ds.latitude.values) * len(ds.longitude.values)
-bar = progress.bar.Bar("Processing", max=max_values)
+	return np.where(azi < 0, azi + 360, azi)
 
-for lat_idx in range(len(arr.latitude)):
-	for lon_idx in range(len(arr.longitude)):
-		
-		u_val = arr[0, lat_idx, lon_idx]
-		v_val = arr[1, lat_idx, lon_idx]
+######################################################################
 
-		this_lat = float(u_val.latitude.values)
-		this_lon = float(u_val.longitude.values)
+def wind_arrays(ds):
 
-		u_val_ms = u_val.values
-		v_val_ms = v_val.values
+	# Pull the u/v grids out of the dataset once, and work out the speed
+	# and direction for every cell in one go
+	import numpy as np
 
-		magnitude = math.sqrt(u_val_ms**2 + v_val_ms**2)
-		azimuth = calculate_azimuth(u_val_ms, v_val_ms)
+	u_vals = ds.u.values.astype(np.float64)
+	v_vals = ds.v.values.astype(np.float64)
 
-		link_idx = link[int(this_lat), int(this_lon)]
-		links[link_idx]["d"].append(create_placemark(this_lat, this_lon, magnitude, azimuth))
+	lats, lons = np.meshgrid(ds.latitude.values, ds.longitude.values, indexing="ij")
 
-		bar.next()
+	return {
+		"latitude": lats,
+		"longitude": lons,
+		"magnitude": np.sqrt(u_vals**2 + v_vals**2),
+		"azimuth": calculate_azimuths(u_vals, v_vals)
+	}
+
+######################################################################
+
+def render_link(wind, nw_link, units="mps", style_url="#m_arrow", timespan=""):
 
-# Open the master KML file
-fp = open("doc.kml", "w")
-print(kml_header("Wind: " + args.date), file=fp)
+	# Returns the placemarks for every wind sample inside one NetworkLink
+	lats = wind["latitude"]
+	lons = wind["longitude"] % 360
 
-# Print out each Network Link
-for idx in range(len(links)):
+	inside = (lats >= nw_link["minlat"]) & ((lats < nw_link["maxlat"]) | (lats == 90)) & \
+		(lons >= nw_link["minlon"]) & (lons < nw_link["maxlon"])
 
-	nw_link = links[idx]
-	linkfilename = f"link{idx:02}.kml"
+	return [create_placemark(lat, lon, magnitude, azimuth, units, style_url, timespan) for (lat, lon, magnitude, azimuth) in zip(
+		lats[inside].tolist(), lons[inside].tolist(),
+		wind["magnitude"][inside].tolist(), wind["azimuth"][inside].tolist())]
 
-	# Print the NetworkLink to the master file
-	print(f"""
+######################################################################
+
+def link_filename(idx):
+
+	return f"link{idx:02}.kml"
+
+######################################################################
+
+def network_link(idx, nw_link, href, refresh_mode="onRegion"):
+
+	return f"""
 	<NetworkLink>
-		<name>{linkfilename}</name>
+		<name>{link_filename(idx)}</name>
 		<Region>
 			<LatLonAltBox>
 				<north>{nw_link["maxlat"]}</north>
@@ -240,33 +225,223 @@ for idx in range(len(links)):
 			</LatLonAltBox>
 		</Region>
 		<Link>
-			<href>files/{linkfilename}</href>
-			<viewRefreshMode>onRegion</viewRefreshMode>
+			<href>{href}</href>
+			<viewRefreshMode>{refresh_mode}</viewRefreshMode>
 		</Link>
 	</NetworkLink>
-	""", file=fp)
+	"""
+
+######################################################################
+
+def date_range(first, last):
+
+	# Every date from first to last (inclusive) as YYYY-MM-DD
+	day = datetime.date.fromisoformat(first)
+	last_day = datetime.date.fromisoformat(last)
+
+	dates = []
+	while (day <= last_day):
+		dates.append(day.isoformat())
+		day += datetime.timedelta(days=1)
+
+	return dates
+
+######################################################################
+
+def create_timespan(date):
+
+	# The GRIB data is the 00Z analysis, so show it for the whole day
+	begin = datetime.date.fromisoformat(date)
+	end = begin + datetime.timedelta(days=1)
+
+	return f"""
+		<TimeSpan>
+			<begin>{begin.isoformat()}T00:00:00Z</begin>
+			<end>{end.isoformat()}T00:00:00Z</end>
+		</TimeSpan>"""
+
+######################################################################
+
+def link_directory(date, animated=False):
+
+	# Animated KMZs keep each date's NetworkLink files apart
+	if (animated):
+		return f"files/{date}"
 
-	# Print each placemark to the child file
-	nw_fp = open(f"files/{linkfilename}", "w")
-	print(kml_header(str(idx)), file=nw_fp)
+	return "files"
 
-	for pm in nw_link["d"]:
-		print(pm, file=nw_fp)
+######################################################################
+
+def write_links(date, level, units, directory, animated=False):
+
+	# Renders every NetworkLink file for a single date. This usually runs in
+	# a worker process, so it writes the files itself rather than shipping
+	# all the placemarks back to the parent
+	ds = grib_downloader.get_dataset(date, level)
+
+	with profiling.span("wind_arrays"):
+		wind = wind_arrays(ds)
 
-	print(kml_footer(), file=nw_fp)
-	nw_fp.close()
+	write_wind_links(wind, units, directory, animated, create_timespan(date) if animated else "")
+
+	return date
+
+######################################################################
 
-print(kml_footer(), file=fp)
-fp.close()
+def write_wind_links(wind, units, directory, animated=False, timespan=""):
 
-# Now write ALLLLL these files into a KMZ zip file
-with zipfile.ZipFile(args.out, "w", compression=zipfile.ZIP_DEFLATED) as z:
-	z.write("doc.kml")
-	z.write("files/windarrow.png")
+	# Writes the NetworkLink files for one set of wind arrays (a date, or a
+	# climatology layer)
+	if (animated):
+		# Styles live once in files/styles.kml, and each date is in its own directory
+		style_url = "../styles.kml#m_arrow"
+	else:
+		style_url = "#m_arrow"
+
+	os.makedirs(directory, exist_ok=True)
 
 	for idx in range(len(links)):
-		linkfilename = f"link{idx:02}.kml"
-		z.write(f"files/{linkfilename}")
+		nw_fp = open(os.path.join(directory, link_filename(idx)), "w")
+		print(kml_header(str(idx), styles=not animated), file=nw_fp)
+
+		with profiling.span("render"):
+			placemarks = render_link(wind, links[idx], units, style_url, timespan)
+
+		with profiling.span("write_kml"):
+			for pm in placemarks:
+				print(pm, file=nw_fp)
+
+		profiling.count("placemarks", len(placemarks))
+
+		print(kml_footer(), file=nw_fp)
+		nw_fp.close()
+
+######################################################################
+
+def write_doc(first, last, dates, animated=False):
+
+	# Open the master KML file
+	fp = open("doc.kml", "w")
+
+	if (animated):
+		print(kml_header(f"Wind: {first} to {last}"), file=fp)
+
+		# One copy of the styles for every date's placemarks to share
+		with open("files/styles.kml", "w") as styles_fp:
+			print(kml_header("Styles"), file=styles_fp)
+			print(kml_footer(), file=styles_fp)
+	else:
+		print(kml_header("Wind: " + first), file=fp)
+
+	# Print out each Network Link, in a folder per date
+	for date in dates:
+
+		if (animated):
+			print(f"""
+	<Folder>
+		<name>{date}</name>{create_timespan(date)}""", file=fp)
+
+		for idx in range(len(links)):
+			print(network_link(idx, links[idx], f"{link_directory(date, animated)}/{link_filename(idx)}"), file=fp)
+
+		if (animated):
+			print("</Folder>", file=fp)
+
+	print(kml_footer(), file=fp)
+	fp.close()
+
+######################################################################
 
+def main():
+
+	# Command line arguments
+	parser = argparse.ArgumentParser(
+				prog='Convert GRIB data to KML PlaceMark file')
+
+	parser.add_argument('--date', help="YYYY-MM-DD") # Date of the GRIB file
+	parser.add_argument('--end', help="YYYY-MM-DD, renders every date from --date to --end for the time slider")
+	parser.add_argument('--level', type=int, choices=[300, 250, 200, 150, 100, 50], default=250, help="hPa") # Atmospheric Level
+	parser.add_argument('--out', required=True, help="KML output file name") # Filename of the output file
+	parser.add_argument("--units", choices=['mph', 'kmh', 'mps'], default='mps')
+	parser.add_argument('--workers', type=int, help="Number of processes (default: one per CPU)")
+	parser.add_argument('--climatology', help="Render a climatology.py statistics file instead of a date")
+	parser.add_argument('--stat', choices=['mean', 'max', 'p50', 'p90', 'p99'], default='mean', help="Which climatology statistic to render")
+	profiling.add_argument(parser)
+
+	args = parser.parse_args()
+
+	if (args.date is None and args.climatology is None):
+		parser.error("one of --date or --climatology is required")
+
+	# Check the dates before anything gets rendered
+	days = {}
+	for (option, value) in (("--date", args.date), ("--end", args.end)):
+		if (value is not None):
+			try:
+				days[option] = datetime.date.fromisoformat(value)
+			except ValueError:
+				parser.error(f"{option} {value} isn't a YYYY-MM-DD date")
+
+	if (len(days) == 2 and days["--end"] < days["--date"]):
+		parser.error("--end is before --date")
+
+	if (args.profile):
+		profiling.start(args.profile)
+
+	import progress.bar # type: ignore
+
+	animated = (args.end is not None and args.climatology is None)
+
+	if (args.climatology):
+		# The layer's name stands in for the date in the document title
+		dates = [f"{os.path.basename(args.climatology)} {args.stat}"]
+	elif (animated):
+		dates = date_range(args.date, args.end)
+	else:
+		dates = [args.date]
+
+	bar = progress.bar.Bar("Processing", max=len(dates))
+
+	if (args.climatology):
+		import climatology # type: ignore
+
+		with profiling.span("write_links"):
+			write_wind_links(climatology.load_layer(args.climatology, args.stat), args.units, link_directory(dates[0]))
+		bar.next()
+	elif (len(dates) == 1):
+		# Not worth starting a pool for (and this way it shows up in --profile)
+		with profiling.span("write_links"):
+			write_links(dates[0], args.level, args.units, link_directory(dates[0], animated), animated)
+		bar.next()
+	else:
+		# Each date is rendered in its own process
+		with profiling.span("write_links"), concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+			futures = [executor.submit(write_links, date, args.level, args.units, link_directory(date, animated), animated) for date in dates]
+
+			for future in concurrent.futures.as_completed(futures):
+				future.result()
+				bar.next()
+
+	bar.finish()
+
+	with profiling.span("write_doc"):
+		write_doc(dates[0], args.end, dates, animated)
+
+	# Now write ALLLLL these files into a KMZ zip file
+	with profiling.span("zip"), zipfile.ZipFile(args.out, "w", compression=zipfile.ZIP_DEFLATED) as z:
+		z.write("doc.kml")
+		z.write("files/windarrow.png")
+
+		if (animated):
+			z.write("files/styles.kml")
+
+		for date in dates:
+			for idx in range(len(links)):
+				z.write(f"{link_directory(date, animated)}/{link_filename(idx)}")
+
+	print(end='\a', file=sys.stderr) # Beep!!
+
+######################################################################
 
-print(end='\a', file=sys.stderr) # Beep!!
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,343 @@
+# Jet cores
+#  Finds every jet stream core on every day, instead of just the single fastest
+# cell in a hand-picked latitude band (see fastest_wind.py and iterate_fw.py).
+#
+# A core is a connected patch of cells where the wind is at least --threshold
+# (cells touching along an edge or a corner, including across 0/360
+# longitude). For each one we report its peak speed and where that is, the
+# direction of its mean wind, its area, and the length of its axis (the line
+# through the fastest cell in each column of longitude). Cores on consecutive
+# days are joined into tracks by how much they overlap.
+#
+# Everything works on a (days, lat, lon) stack at once, so a year of grids
+# takes seconds once it's decoded.
+import argparse
+import csv
+import datetime
+import os
+import sys
+import numpy as np
+import airport_table # type: ignore
+import flight_times # type: ignore
+import grib_downloader # type: ignore
+import profiling # type: ignore
+import wind_route # type: ignore
+
+EARTH_RADIUS = 6371.0088 # km
+
+# Default core threshold, in metres per second (about 58 kts)
+THRESHOLD = 30
+
+# How many days to label at once, to keep the temporary arrays small
+CHUNK_DAYS = 32
+
+UNITS = {
+	"mps": 1.0,
+	"mph": 2.23694,
+	"kmh": 3.6,
+	"kts": 1.94384
+}
+
+######################################################################
+
+def label_cores(mask):
+
+	# Numbers the connected regions of True in a (days, lat, lon) mask, in
+	# order of their first cell. Returns an array the same shape holding each
+	# cell's region, or -1, and how many regions there are.
+	#
+	# Rather than cell by cell, this works on runs of True along each row of
+	# latitude: runs in neighbouring rows are joined if they touch (including
+	# at a corner), and the joins are followed until every run has the
+	# smallest number in its region. A jet only spans a few dozen rows, so
+	# that settles quickly however far it snakes around the globe
+	(days, nlat, nlon) = mask.shape
+
+	# Each row gets a copy of its first column on the end, so runs that touch
+	# across 0/360 longitude (straight across or at a corner) are found like
+	# any other, and then a False column so runs can't spill into the next row
+	width = nlon + 2
+	padded = np.zeros((days * nlat, width), dtype=bool)
+	padded[:, :nlon] = mask.reshape(-1, nlon)
+	padded[:, nlon] = padded[:, 0]
+	padded = padded.ravel()
+
+	edges = np.diff(padded.view(np.int8), prepend=0)
+	starts = np.flatnonzero(edges == 1)
+	ends = np.flatnonzero(edges == -1) - 1
+	row = starts // width
+
+	if (len(starts) == 0):
+		return np.full(mask.shape, -1), 0
+
+	run = np.cumsum(edges == 1) - 1
+
+	# Runs in the next row (of the same day) that touch each run
+	lo = np.searchsorted(ends, starts + width - 1)
+	hi = np.searchsorted(starts, ends + width + 1, side="right")
+	counts = np.where(row % nlat == nlat - 1, 0, np.maximum(hi - lo, 0))
+
+	first = np.repeat(lo - np.cumsum(counts) + counts, counts)
+	joined_a = np.repeat(np.arange(len(starts)), counts)
+	joined_b = first + np.arange(len(first))
+
+	# The copy of the first column is the same cell as the first column
+	wrapped = np.flatnonzero(padded[nlon::width]) * width
+	joined_a = np.concatenate((joined_a, run[wrapped]))
+	joined_b = np.concatenate((joined_b, run[wrapped + nlon]))
+
+	regions = np.arange(len(starts))
+
+	while True:
+		smallest = np.minimum(regions[joined_a], regions[joined_b])
+
+		updated = regions.copy()
+		np.minimum.at(updated, joined_a, smallest)
+		np.minimum.at(updated, joined_b, smallest)
+
+		# Follow each run's number to the run it names, which may already
+		# have been given an even smaller one
+		while True:
+			jumped = updated[updated]
+			if (np.array_equal(jumped, updated)):
+				break
+			updated = jumped
+
+		if (np.array_equal(updated, regions)):
+			break
+
+		regions = updated
+
+	(roots, regions) = np.unique(regions, return_inverse=True)
+
+	ids = np.where(padded, regions[run], -1).reshape(-1, width)[:, :nlon]
+
+	return ids.reshape(mask.shape), len(roots)
+
+######################################################################
+
+def find_cores(speed, threshold):
+
+	# Numbers the cores in a (days, lat, lon) array of wind speeds. Returns an
+	# int32 array the same shape holding each cell's core, or -1 if it isn't
+	# in one. Cores are numbered in day order
+	ids = np.full(speed.shape, -1, dtype=np.int32)
+	count = 0
+
+	for start in range(0, len(speed), CHUNK_DAYS):
+		(chunk, cores) = label_cores(speed[start:start + CHUNK_DAYS] >= threshold)
+
+		ids[start:start + CHUNK_DAYS] = np.where(chunk >= 0, chunk + count, -1)
+		count += cores
+
+	return ids
+
+######################################################################
+
+def group_last(keys, values):
+
+	# Index of the largest value for each key, in key order
+	order = np.lexsort((values, keys))
+	ends = np.flatnonzero(np.diff(keys[order]))
+
+	if (len(order) == 0):
+		return order
+
+	return order[np.append(ends, len(order) - 1)]
+
+######################################################################
+
+def axis_lengths(wind, core, lat_idx, lon_idx, speed, cores):
+
+	# The axis is the fastest cell in each column of longitude that the core
+	# covers, joined up west to east. A core that crosses 0/360 longitude
+	# starts after the widest gap in its columns, so it's joined up the
+	# right way round
+	nlon = len(wind["longitude"])
+
+	axis = group_last(core.astype(np.int64) * nlon + lon_idx, speed)
+	(axis_core, axis_lat, axis_lon) = (core[axis], lat_idx[axis], lon_idx[axis])
+
+	# Columns to the next axis point east, wrapping around for the last
+	first = np.searchsorted(axis_core, axis_core)
+	last = np.searchsorted(axis_core, axis_core, side="right") - 1
+	following = np.where(np.arange(len(axis)) == last, axis_lon[first] + nlon, np.roll(axis_lon, -1))
+
+	widest = group_last(axis_core, following - axis_lon)
+	start = following[widest] % nlon
+
+	order = np.lexsort(((axis_lon - start[axis_core]) % nlon, axis_core))
+	(axis_core, axis_lat, axis_lon) = (axis_core[order], axis_lat[order], axis_lon[order])
+
+	lats = wind["latitude"][axis_lat]
+	lons = wind["longitude"][axis_lon]
+
+	steps = airport_table.angular_distance(lats[:-1], lons[:-1], lats[1:], lons[1:])
+	steps = np.radians(steps) * EARTH_RADIUS
+	same = axis_core[:-1] == axis_core[1:]
+
+	return np.bincount(axis_core[:-1][same], weights=steps[same], minlength=cores)
+
+######################################################################
+
+def measure_cores(wind, ids):
+
+	# Peak speed (m/s) and its position, mean wind direction, area (km²) and
+	# axis length (km) of every core numbered by find_cores()
+	cells = np.flatnonzero(ids >= 0)
+	core = ids.ravel()[cells]
+	(day, lat_idx, lon_idx) = np.unravel_index(cells, ids.shape)
+
+	u_vals = wind["u"][day, lat_idx, lon_idx]
+	v_vals = wind["v"][day, lat_idx, lon_idx]
+	speed = np.sqrt(u_vals**2 + v_vals**2)
+
+	cores = int(core.max()) + 1 if len(core) else 0
+	peak = group_last(core, speed)
+
+	# Every cell is dlat by dlon degrees, which is less area towards the poles
+	dlat = abs(wind["latitude"][1] - wind["latitude"][0])
+	dlon = abs(wind["longitude"][1] - wind["longitude"][0])
+	cell_area = np.radians(dlat) * np.radians(dlon) * EARTH_RADIUS**2 * np.cos(np.radians(wind["latitude"]))
+
+	# The direction of the summed wind vectors, so faster cells count for more
+	mean_u = np.bincount(core, weights=u_vals, minlength=cores)
+	mean_v = np.bincount(core, weights=v_vals, minlength=cores)
+
+	return {
+		"day": day[peak],
+		"speed": speed[peak],
+		"latitude": wind["latitude"][lat_idx[peak]],
+		"longitude": wind["longitude"][lon_idx[peak]],
+		"azimuth": wind_route.calculate_azimuths(mean_u, mean_v),
+		"area": np.bincount(core, weights=cell_area[lat_idx], minlength=cores),
+		"axis": axis_lengths(wind, core, lat_idx, lon_idx, speed, cores)
+	}
+
+######################################################################
+
+def track_cores(ids, cores, linked):
+
+	# Joins each core to the core on the next day that it overlaps the most
+	# (if that core doesn't overlap something else even more). linked[d] says
+	# whether days d and d + 1 are consecutive. Returns a track number for
+	# every core
+	both = (ids[:-1] >= 0) & (ids[1:] >= 0) & linked[:, None, None]
+	pairs = ids[:-1][both].astype(np.int64) * cores + ids[1:][both]
+
+	(pairs, overlaps) = np.unique(pairs, return_counts=True)
+
+	predecessor = np.full(cores, -1)
+	has_successor = np.zeros(cores, dtype=bool)
+
+	for pair in pairs[np.argsort(-overlaps, kind="stable")]:
+		(before, after) = divmod(int(pair), cores)
+
+		if (predecessor[after] < 0 and not has_successor[before]):
+			predecessor[after] = before
+			has_successor[before] = True
+
+	# Cores are numbered in day order, so a predecessor always has its track
+	tracks = np.full(cores, -1)
+	count = 0
+
+	for core in range(cores):
+		if (predecessor[core] >= 0):
+			tracks[core] = tracks[predecessor[core]]
+		else:
+			tracks[core] = count
+			count += 1
+
+	return tracks
+
+######################################################################
+
+def jet_cores(wind, dates, threshold=THRESHOLD):
+
+	# All the cores in a stack of u/v grids (see flight_times.stack_winds),
+	# with the date and track of each one
+	with profiling.span("label"):
+		ids = find_cores(np.sqrt(wind["u"]**2 + wind["v"]**2), threshold)
+
+	with profiling.span("measure"):
+		cores = measure_cores(wind, ids)
+
+	profiling.count("cores", len(cores["day"]))
+
+	with profiling.span("track"):
+		days = [datetime.date.fromisoformat(date) for date in dates]
+		linked = np.array([(b - a).days == 1 for (a, b) in zip(days[:-1], days[1:])], dtype=bool)
+
+		cores["track"] = track_cores(ids, len(cores["day"]), linked)
+
+	cores["date"] = np.array(dates)[cores["day"]]
+
+	return cores
+
+######################################################################
+
+def archived_dates(level):
+
+	# Every date we already have a GRIB file for at this level
+	suffix = f"_{level}.grib"
+
+	return sorted(f[:-len(suffix)] for f in os.listdir(grib_downloader.DATA_DIR) if f.endswith(suffix))
+
+######################################################################
+
+def main():
+
+	# Command line arguments
+	parser = argparse.ArgumentParser(
+				prog='Jet cores',
+				description='Finds and tracks every jet stream core over a range of dates')
+
+	parser.add_argument('--end', default=(datetime.date.today() - datetime.timedelta(days=1)).isoformat(), help="YYYY-MM-DD, last date (default: yesterday)")
+	parser.add_argument('--days', type=flight_times.day_count, default=30, help="Number of days up to --end")
+	parser.add_argument('--all', action="store_true", default=False, help="Every date already in the data directory instead")
+	parser.add_argument("--level", type=int, choices=[300, 250, 200, 150, 100, 50], default=250, help="hPa")
+	parser.add_argument("--units", choices=list(UNITS), default='kts')
+	parser.add_argument('--threshold', type=float, help=f"Slowest wind in a core, in --units (default: {THRESHOLD} m/s)")
+	parser.add_argument('--min-area', type=float, default=0, help="Leave out cores smaller than this, in km²")
+	parser.add_argument("--out") # Write to a named CSV file
+	profiling.add_argument(parser)
+
+	args = parser.parse_args()
+
+	if (args.profile):
+		profiling.start(args.profile)
+
+	factor = UNITS[args.units]
+	threshold = THRESHOLD if args.threshold is None else args.threshold / factor
+
+	if (args.all):
+		dates = archived_dates(args.level)
+	else:
+		dates = flight_times.last_n_days(args.end, args.days)
+
+	with profiling.span("stack_winds"):
+		wind = flight_times.stack_winds(dates, args.level)
+
+	cores = jet_cores(wind, dates, threshold)
+
+	# Output file
+	if (args.out):
+		fp = open(args.out, "w", newline="")
+	else:
+		fp = sys.stdout
+
+	writer = csv.writer(fp)
+	writer.writerow(["date", "level", "speed", "units", "azimuth", "latitude", "longitude", "track", "area_km2", "axis_km"])
+
+	for idx in np.flatnonzero(cores["area"] >= args.min_area):
+		writer.writerow([cores["date"][idx], args.level, f"{cores['speed'][idx] * factor:.2f}", args.units,
+			f"{cores['azimuth'][idx]:.0f}", cores["latitude"][idx], cores["longitude"][idx],
+			cores["track"][idx], f"{cores['area'][idx]:.0f}", f"{cores['axis'][idx]:.0f}"])
+
+	if (args.out):
+		fp.close()
+
+######################################################################
+
+if __name__ == "__main__":
+	main()
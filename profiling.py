@@ -0,0 +1,172 @@
+# Profiling
+#  Named timing spans, counters and peak memory for each stage of the tools
+# (download, decode, KML parsing, wind lookup, geodesic maths, KML writing...).
+#
+#	with profiling.span("decode"):
+#		ds = cfgrib.open_dataset(filename).load()
+#
+# Nothing is recorded until start() is called (the tools do that for
+# --profile), and until then span() hands back a shared do-nothing object, so
+# the spans can stay in the inner loops.
+#
+# Spans nest, and are reported by their path ("analyse;parse_trail;wind").
+# The report is JSON, or the "collapsed stack" format that flamegraph.pl and
+# speedscope read. Only the process that called start() is profiled; work
+# farmed out to a process pool shows up as the time spent waiting for it.
+import atexit
+import json
+import sys
+import threading
+import time
+
+try:
+	import resource
+except ImportError: # Windows
+	resource = None
+
+enabled = False
+started = None
+
+# path -> [count, total seconds, seconds in child spans, longest, peak RSS in KB]
+spans = {}
+counters = {}
+
+lock = threading.Lock()
+local = threading.local()
+
+######################################################################
+
+def peak_rss():
+
+	# Peak resident memory of this process so far, in KB
+	if (resource is None):
+		return 0
+
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+	# macOS reports bytes, Linux reports KB
+	if (sys.platform == "darwin"):
+		rss //= 1024
+
+	return rss
+
+######################################################################
+
+class NullSpan:
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+NULL_SPAN = NullSpan()
+
+######################################################################
+
+class Span:
+
+	def __init__(self, name):
+		self.name = name
+
+	def __enter__(self):
+
+		if (not hasattr(local, "stack")):
+			local.stack = []
+
+		local.stack.append(self.name)
+		self.path = ";".join(local.stack)
+		self.start = time.perf_counter()
+
+		return self
+
+	def __exit__(self, *exc):
+
+		elapsed = time.perf_counter() - self.start
+		local.stack.pop()
+		rss = peak_rss()
+
+		with lock:
+			stats = spans.setdefault(self.path, [0, 0.0, 0.0, 0.0, 0])
+			stats[0] += 1
+			stats[1] += elapsed
+			stats[3] = max(stats[3], elapsed)
+			stats[4] = max(stats[4], rss)
+
+			# So the parent can work out how long it spent on its own
+			if (local.stack):
+				parent = spans.setdefault(";".join(local.stack), [0, 0.0, 0.0, 0.0, 0])
+				parent[2] += elapsed
+
+		return False
+
+######################################################################
+
+def span(name):
+
+	if (not enabled):
+		return NULL_SPAN
+
+	return Span(name)
+
+######################################################################
+
+def count(name, n=1):
+
+	if (enabled):
+		with lock:
+			counters[name] = counters.get(name, 0) + n
+
+######################################################################
+
+def report():
+
+	return {
+		"wall_seconds": time.perf_counter() - started,
+		"peak_rss_kb": peak_rss(),
+		"counters": dict(counters),
+		"spans": {path: {
+			"count": stats[0],
+			"total_seconds": stats[1],
+			"self_seconds": stats[1] - stats[2],
+			"max_seconds": stats[3],
+			"peak_rss_kb": stats[4]
+		} for (path, stats) in spans.items()}
+	}
+
+######################################################################
+
+def collapsed_stacks():
+
+	# One "path microseconds" line per span, using the time spent in the
+	# span itself (not its children), which is what flame graphs expect
+	return "\n".join(f"{path} {max(round((stats[1] - stats[2]) * 1e6), 0)}" for (path, stats) in spans.items())
+
+######################################################################
+
+def write_report(filename):
+
+	with open(filename, "w") as fp:
+		if (filename.endswith(".json")):
+			json.dump(report(), fp, indent=2)
+		else:
+			print(collapsed_stacks(), file=fp)
+
+######################################################################
+
+def start(filename):
+
+	# Turn profiling on, and write the report to filename (.json for JSON,
+	# anything else for collapsed stacks) when the program exits
+	global enabled, started
+
+	enabled = True
+	started = time.perf_counter()
+
+	atexit.register(write_report, filename)
+
+######################################################################
+
+def add_argument(parser):
+
+	parser.add_argument("--profile", help="Write a timing/memory profile to this file (.json, or collapsed stacks for a flame graph)")
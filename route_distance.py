@@ -1,53 +1,36 @@
-import pyproj # type: ignore
 import argparse
+import concurrent.futures
+import csv
+import functools
+import itertools
 import math
+import os
+import sys
+import profiling # type: ignore
 
-from airports import airports # type: ignore
+from airports import airports, lookup # type: ignore
 
-# Command line arguments
-parser = argparse.ArgumentParser(
-            prog='Route Distance',
-            description='Computes the distance between two points on both globe and the AE map')
+# numpy takes a while to import, so it's imported by the functions that use
+# it rather than here, and --help doesn't have to wait for it
 
-parser.add_argument("-v", "--verbose", action="store_true", default=False)
-# parser.add_argument("--units", choices=['mi', 'km', 'nm'], default='nm')
+# The four ways of measuring a route, all in nautical miles
+METRICS = ["globe_route", "ae_route", "globe_route_on_ae", "ae_route_on_globe"]
 
-# The origin and destination arguments can either be the name of an airport (see airports.py) or
-# a comma separated lat,lon. However, because coordinates in the south start with a "-" symbol, and
-# the minus symbol on the command line denotes a new switch argument, you need to remove the space
-# between the switch and the coordinates.
-#
-# -o sydney		VALID
-#
-# -d -30,140	INVALID
-# -d-30,140		VALID
+GLOBE_HOP = 5000 # metres to travel each hop along the globe route
+AE_HOP = 3 # nautical miles to travel each hop along the AE route
 
-parser.add_argument('-o', '--orig', required=True, help="Coordinates in the south *CANNOT* be separated by a space. e.g. -o-30,100")
-parser.add_argument('-d', '--dest', required=True, help="Coordinates in the south *CANNOT* be separated by a space. e.g. -d-30,100")
+MAX_SEGMENTS = 2**22 # Give up refining after this many
+START_SEGMENTS = 16
 
-args = parser.parse_args()
-
-# Now try to parse the origin and destination from the command line
-if args.orig in airports:
-	args.lat1,args.lon1 = airports[args.orig]
-else:
-	# Try to parse it as a float,float
-	vals = args.orig.split(",")
-	args.lat1,args.lon1 = (float(vals[0]), float(vals[1]))
+################################################################################
 
-if args.dest in airports:
-	args.lat2,args.lon2 = airports[args.dest]
-else:
-	# Try to parse it as a float,float
-	vals = args.dest.split(",")
-	args.lat2,args.lon2 = (float(vals[0]), float(vals[1]))
+@functools.lru_cache(maxsize=None)
+def get_geod():
 
-if (args.verbose):
-	print("arguments:", args)
+	# pyproj is slow to import, so wait until something needs it
+	import pyproj # type: ignore
 
-g = pyproj.Geod(ellps="WGS84")
-results = {} # All in nautical miles
-results["units"] = "nautical miles"
+	return pyproj.Geod(ellps="WGS84")
 
 ################################################################################
 
@@ -55,125 +38,346 @@ def delta_longitude(lon1, lon2):
 
 	# Returns the difference between the longitudes, where a positive result
 	# means lon1 -> lon2 is travelling east.
-	diff = lon2 - lon1
+	import numpy as np
 
-	if (diff < -180):
-		diff += 360
+	diff = np.asarray(lon2) - np.asarray(lon1)
 
-	return diff
+	return np.where(diff < -180, diff + 360, diff)
 
 ################################################################################
 
 def ae_distance_between(lat1, lon1, lat2, lon2):
 
-	# Calculate the distance for the AE map in NMI
+	# Calculate the distance for the AE map in NMI. Works on single
+	# coordinates or whole numpy arrays of them
+	import numpy as np
 
 	# Draw a big triangle with one point at the north pole, and the
 	# other two points are the given coordinates
 	delta_lon = delta_longitude(lon1, lon2)
 
-	side_a = (90 - lat1) * 60
-	side_b = (90 - lat2) * 60
+	side_a = (90 - np.asarray(lat1)) * 60
+	side_b = (90 - np.asarray(lat2)) * 60
 
-	side_c = math.sqrt(side_a**2 + side_b**2 - 2 * side_a * side_b * math.cos(math.radians(delta_lon)))
+	# Rounding can leave a tiny negative number when the points are (nearly) the same
+	side_c_sq = side_a**2 + side_b**2 - 2 * side_a * side_b * np.cos(np.radians(delta_lon))
 
-	return side_c
+	return np.sqrt(np.maximum(side_c_sq, 0))
 
 ################################################################################
 
-def ae_azimuth_to(lat1, lon1, lat2, lon2):
+def ae_to_xy(lat, lon):
 
-	delta_lon = delta_longitude(lon1, lon2)
+	# Position on the AE map in nautical miles, with the north pole at 0,0
+	import numpy as np
 
-	side_a = (90 - lat1) * 60
-	side_b = ae_distance_between(lat1, lon1, lat2, lon2)
-	side_c = (90 - lat2) * 60
+	radius = (90 - np.asarray(lat)) * 60
+	theta = np.radians(lon)
 
-	# Rearrange the Law of Cosines to work out the angle
-	az = math.degrees(math.acos((side_a**2 + side_b**2 - side_c**2) / (2 * side_a * side_b)))
+	return radius * np.cos(theta), radius * np.sin(theta)
 
-	if (delta_lon > 0):
-		return az
-	else:
-		return -az
+################################################################################
+
+def xy_to_ae(x, y):
+
+	import numpy as np
+
+	lat = 90 - np.hypot(x, y) / 60
+	lon = np.degrees(np.arctan2(y, x))
+
+	return lat, lon
+
+################################################################################
+
+def globe_track(lat1, lon1, lat2, lon2, segments):
+
+	# Every point along the geodesic, split into equal segments
+	import numpy as np
+
+	track = get_geod().inv_intermediate(lon1, lat1, lon2, lat2, npts=segments + 1,
+		initial_idx=0, terminus_idx=0, return_back_azimuth=False)
+
+	return np.array(track.lats), np.array(track.lons)
+
+################################################################################
+
+def ae_track(lat1, lon1, lat2, lon2, segments):
+
+	# The AE route is a straight line on the map, so just interpolate
+	# between the two points in x/y
+	import numpy as np
+
+	x1, y1 = ae_to_xy(lat1, lon1)
+	x2, y2 = ae_to_xy(lat2, lon2)
+
+	t = np.linspace(0, 1, segments + 1)
+
+	return xy_to_ae(x1 + t * (x2 - x1), y1 + t * (y2 - y1))
+
+################################################################################
+
+def ae_length(lats, lons):
+
+	# Length of a track as if it were drawn on the AE map, in NMI
+	import numpy as np
+
+	return float(np.sum(ae_distance_between(lats[:-1], lons[:-1], lats[1:], lons[1:])))
+
+################################################################################
+
+def globe_length(lats, lons):
+
+	# Length of a track as if it were drawn on the globe, in NMI
+	import numpy as np
+
+	az12,az21,dist = get_geod().inv(lons[:-1], lats[:-1], lons[1:], lats[1:])
+
+	return float(np.sum(dist)) / 1852
+
+################################################################################
+
+def refine(length_of, segments, tolerance):
+
+	# Keep doubling the number of segments until the answer stops moving
+	# by more than the tolerance (nautical miles)
+	length = length_of(segments)
+	profiling.count("refinements")
+
+	while (segments < MAX_SEGMENTS):
+		segments *= 2
+		new_length = length_of(segments)
+		profiling.count("refinements")
+
+		if (abs(new_length - length) < tolerance):
+			return new_length
+
+		length = new_length
+
+	return length
+
+################################################################################
+
+def parse_location(location):
+
+	# Either the name of an airport (see airports.py), an IATA/ICAO code or a
+	# comma separated lat,lon
+	coords = lookup(location)
+	if (coords):
+		return coords
+
+	# Try to parse it as a float,float
+	vals = location.split(",")
+
+	return (float(vals[0]), float(vals[1]))
+
+################################################################################
+
+def route_distances(lat1, lon1, lat2, lon2, tolerance=None):
+
+	# Returns all four METRICS for a single origin/destination pair. Without
+	# a tolerance the routes are walked in fixed GLOBE_HOP/AE_HOP hops,
+	# otherwise they are refined until they move by less than the tolerance.
+	# Each caller gets its own dict, so changing it can't spoil the cache
+	return dict(zip(METRICS, cached_distances(lat1, lon1, lat2, lon2, tolerance)))
+
+################################################################################
+
+@functools.lru_cache(maxsize=None)
+def cached_distances(lat1, lon1, lat2, lon2, tolerance=None):
+
+	# route_distances(), as a tuple in METRICS order
+	results = {}
+
+	# Calculate the distance for the globe
+	with profiling.span("globe_route"):
+		az12,az21,dist = get_geod().inv(lon1, lat1, lon2, lat2)
+		results["globe_route"] = dist / 1852
+
+	# Calculate the distance for the AE map
+	with profiling.span("ae_route"):
+		results['ae_route'] = float(ae_distance_between(lat1, lon1, lat2, lon2))
+
+	# Calculate the distance for the globe route BUT ON THE AE MAP!
+	def globe_route_on_ae(segments):
+		return ae_length(*globe_track(lat1, lon1, lat2, lon2, segments))
+
+	# Calculate the distance for the AE route BUT ON THE GLOBE!
+	def ae_route_on_globe(segments):
+		return globe_length(*ae_track(lat1, lon1, lat2, lon2, segments))
+
+	with profiling.span("globe_route_on_ae"):
+		if (tolerance):
+			results['globe_route_on_ae'] = refine(globe_route_on_ae, START_SEGMENTS, tolerance)
+		else:
+			results['globe_route_on_ae'] = globe_route_on_ae(max(math.ceil(dist / GLOBE_HOP), 1))
+
+	with profiling.span("ae_route_on_globe"):
+		if (tolerance):
+			results['ae_route_on_globe'] = refine(ae_route_on_globe, START_SEGMENTS, tolerance)
+		else:
+			results['ae_route_on_globe'] = ae_route_on_globe(max(math.ceil(results['ae_route'] / AE_HOP), 1))
+
+	return tuple(results[metric] for metric in METRICS)
 
 ################################################################################
 
-def ae_forward_point(lat, lon, az, dist):
+def pair_distances(pair, tolerance=None):
+
+	# One row of the distance matrix. Lives at the top level so the process
+	# pool can pickle it
+	(orig, dest) = pair
+	(lat1, lon1) = parse_location(orig)
+	(lat2, lon2) = parse_location(dest)
 
-	# Start at lat/lon, and move "dist" nautical miles at an azimuth of "az"
-	side_a = (90 - lat) * 60
-	side_b = dist
+	row = {"orig": orig, "dest": dest}
+	row.update(route_distances(lat1, lon1, lat2, lon2, tolerance))
 
-	side_c = math.sqrt(side_a**2 + side_b**2 - 2 * side_a * side_b * math.cos(math.radians(az)))
+	return row
 
-	new_lat = 90 - (side_c / 60)
-	delta_lon = math.degrees(math.asin(side_b / side_c * math.sin(math.radians(az))))
+################################################################################
+
+def airport_pairs():
 
-	return new_lat, lon + delta_lon
+	# Every airport to every other airport
+	return list(itertools.permutations(airports.keys(), 2))
 
 ################################################################################
 
-# Calculate the distance for the globe
-az12,az21,dist = g.inv(args.lon1, args.lat1, args.lon2, args.lat2)
-results["globe_route"] = dist / 1852
+def read_pairs(filename):
+
+	# A CSV file with "orig" and "dest" columns. Coordinates need quoting,
+	# e.g. sydney,"-30,100"
+	with open(filename, newline="") as fp:
+		return [(row["orig"], row["dest"]) for row in csv.DictReader(fp)]
 
 ################################################################################
 
-# Calculate the distance for the AE map
-results['ae_route'] = ae_distance_between(args.lat1, args.lon1, args.lat2, args.lon2)
+def distance_matrix(pairs, tolerance=None, workers=None):
+
+	# Yields a row per pair, in order, as soon as each one is ready. The same
+	# pair is only ever worked out once
+	unique_pairs = list(dict.fromkeys(pairs))
+	compute = functools.partial(pair_distances, tolerance=tolerance)
+
+	# A few chunks per worker keeps them all busy without a round trip per pair
+	chunksize = max(len(unique_pairs) // (4 * (workers or os.cpu_count() or 1)), 1)
+
+	with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+		rows = {}
+		next_idx = 0
+
+		for row in executor.map(compute, unique_pairs, chunksize=chunksize):
+			rows[(row["orig"], row["dest"])] = row
+
+			# Hand back the rows (including any duplicates) that are now complete
+			while (next_idx < len(pairs) and pairs[next_idx] in rows):
+				yield rows[pairs[next_idx]]
+				next_idx += 1
 
 ################################################################################
 
-# Calculate the distance for the globe route BUT ON THE AE MAP!
+def write_matrix(rows, filename, chunk_rows=10000):
+
+	# Streams the rows out to CSV or (if pyarrow is installed) Parquet
+	columns = ["orig", "dest"] + METRICS
 
-# Start at lat1, lat2 and get an azimuth to the destination
-old_lat = args.lat1
-old_lon = args.lon1
+	if (filename.endswith(".parquet")):
+		import pyarrow # type: ignore
+		import pyarrow.parquet # type: ignore
 
-hop_distance = 5000 # metres to travel each hop
-ae_dist = 0 # Nautical Miles
+		schema = pyarrow.schema([("orig", pyarrow.string()), ("dest", pyarrow.string())] +
+			[(metric, pyarrow.float64()) for metric in METRICS])
 
-az12,az21,dist = g.inv(old_lon, old_lat, args.lon2, args.lat2)
+		with pyarrow.parquet.ParquetWriter(filename, schema) as writer:
+			chunk = []
 
-while (dist > hop_distance):
-	# Move X metres along the globe route, but then calculate the
-	# DISTANCE as if it were on the AE map
-	new_lon, new_lat, backaz = g.fwd(old_lon, old_lat, az12, hop_distance)
-	ae_dist += ae_distance_between(old_lat, old_lon, new_lat, new_lon)
+			for row in rows:
+				chunk.append(row)
 
-	old_lat = new_lat
-	old_lon = new_lon
-	az12,az21,dist = g.inv(old_lon, old_lat, args.lon2, args.lat2)
+				if (len(chunk) == chunk_rows):
+					writer.write_table(pyarrow.Table.from_pylist(chunk, schema=schema))
+					chunk = []
+
+			if (chunk):
+				writer.write_table(pyarrow.Table.from_pylist(chunk, schema=schema))
+	else:
+		with open(filename, "w", newline="") as fp:
+			writer = csv.DictWriter(fp, fieldnames=columns)
+			writer.writeheader()
 
-results['globe_route_on_ae'] = ae_dist
+			for row in rows:
+				writer.writerow(row)
 
 ################################################################################
 
-# Calculate the distance for the AE route BUT ON THE GLOBE!
-old_lat = args.lat1
-old_lon = args.lon1
+def main():
 
-hop_distance = 3 # Nautical Miles
-globe_dist = 0
+	# Command line arguments
+	parser = argparse.ArgumentParser(
+				prog='Route Distance',
+				description='Computes the distance between two points on both globe and the AE map')
 
-az12 = ae_azimuth_to(old_lat, old_lon, args.lat2, args.lon2)
-dist = ae_distance_between(old_lat, old_lon, args.lat2, args.lon2)
+	parser.add_argument("-v", "--verbose", action="store_true", default=False)
+	# parser.add_argument("--units", choices=['mi', 'km', 'nm'], default='nm')
 
-while (dist > hop_distance):
-	# Move X nautical miles along the AE route, but then calculate the
-	# DISTANCE as if it were on the globe
-	new_lat,new_lon = ae_forward_point(old_lat, old_lon, az12, hop_distance)
-	tmpaz12,tmpaz21,tmpdist = g.inv(old_lon, old_lat, new_lon, new_lat)
-	globe_dist += tmpdist / 1852
+	# The origin and destination arguments can either be the name of an airport (see airports.py) or
+	# a comma separated lat,lon. However, because coordinates in the south start with a "-" symbol, and
+	# the minus symbol on the command line denotes a new switch argument, you need to remove the space
+	# between the switch and the coordinates.
+	#
+	# -o sydney		VALID
+	#
+	# -d -30,140	INVALID
+	# -d-30,140		VALID
 
-	old_lat = new_lat
-	old_lon = new_lon
-	az12 = ae_azimuth_to(old_lat, old_lon, args.lat2, args.lon2)
-	dist = ae_distance_between(old_lat, old_lon, args.lat2, args.lon2)
+	parser.add_argument('-o', '--orig', help="Coordinates in the south *CANNOT* be separated by a space. e.g. -o-30,100")
+	parser.add_argument('-d', '--dest', help="Coordinates in the south *CANNOT* be separated by a space. e.g. -d-30,100")
 
-results['ae_route_on_globe'] = globe_dist
+	# Without a tolerance, the globe route is walked in 5000 m hops and the AE route in 3 nm hops
+	parser.add_argument('-t', '--tolerance', type=float, help="Keep refining the routes until they change by less than this many nautical miles")
+
+	# Batch mode, instead of a single --orig/--dest
+	parser.add_argument('--all', action="store_true", default=False, help="Every pair of airports in airports.py")
+	parser.add_argument('--pairs', help="CSV file with orig,dest columns")
+	parser.add_argument('--out', help="Write the batch results to this .csv or .parquet file (default: CSV to stdout)")
+	parser.add_argument('--workers', type=int, help="Number of processes (default: one per CPU)")
+	profiling.add_argument(parser)
+
+	args = parser.parse_args()
+
+	if (args.profile):
+		profiling.start(args.profile)
+
+	if (args.verbose):
+		print("arguments:", args)
+
+	if (args.all or args.pairs):
+		pairs = airport_pairs() if args.all else read_pairs(args.pairs)
+		rows = distance_matrix(pairs, args.tolerance, args.workers)
+
+		# The rows are worked out as they're written, so this is the whole batch
+		with profiling.span("distance_matrix"):
+			if (args.out):
+				write_matrix(rows, args.out)
+			else:
+				writer = csv.DictWriter(sys.stdout, fieldnames=["orig", "dest"] + METRICS)
+				writer.writeheader()
+				writer.writerows(rows)
+
+	elif (args.orig and args.dest):
+		(lat1, lon1) = parse_location(args.orig)
+		(lat2, lon2) = parse_location(args.dest)
+
+		results = {} # All in nautical miles
+		results["units"] = "nautical miles"
+		results.update(route_distances(lat1, lon1, lat2, lon2, args.tolerance))
+
+		print(results)
+
+	else:
+		parser.error("either --orig and --dest, or --all or --pairs, are required")
 
 ################################################################################
 
-print(results)
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,148 @@
+# Synthetic data
+#  Stand-ins for the GFS wind data and FlightRadar24 KML files, so the tools
+# can be exercised (and benchmarked) without network access or real data.
+#
+# wind_dataset() gives the same coordinates and variables that
+# grib_downloader.get_dataset() gets from cfgrib for a NOMADS download, and
+# flight_kml() gives a KML file with Route and Trail folders like FR24's.
+import argparse
+import datetime
+import sys
+import numpy as np
+import route_distance # type: ignore
+
+######################################################################
+
+def wind_dataset(resolution=1.0, date="2024-06-18", level=250, seed=0):
+
+	# A jet stream in each hemisphere that meanders with longitude, plus some
+	# noise. The grid matches grib_downloader's NOMADS subregion: latitudes
+	# 89 to -89 (north first) and longitudes 1 to 360
+	import xarray # type: ignore
+
+	lats = np.arange(89, -89 - resolution / 2, -resolution)
+	lons = np.arange(1, 360 + resolution / 2, resolution)
+
+	lat_grid, lon_grid = np.meshgrid(lats, lons, indexing="ij")
+	rng = np.random.default_rng(seed)
+
+	u = np.zeros(lat_grid.shape)
+	v = np.zeros(lat_grid.shape)
+
+	for (centre, peak) in ((-40, 70), (40, 60)):
+		axis = centre + 8 * np.sin(np.radians(3 * lon_grid))
+		jet = peak * np.exp(-((lat_grid - axis) / 6)**2)
+
+		u += jet
+		v += jet * 0.3 * np.cos(np.radians(3 * lon_grid))
+
+	u += rng.normal(0, 5, u.shape)
+	v += rng.normal(0, 5, v.shape)
+
+	time = np.datetime64(date, "ns")
+	attrs = {"units": "m s**-1", "GRIB_typeOfLevel": "isobaricInhPa"}
+
+	return xarray.Dataset(
+		{
+			"u": (("latitude", "longitude"), u.astype(np.float32), dict(attrs, long_name="U component of wind", GRIB_shortName="u")),
+			"v": (("latitude", "longitude"), v.astype(np.float32), dict(attrs, long_name="V component of wind", GRIB_shortName="v"))
+		},
+		coords={
+			"time": time,
+			"step": np.timedelta64(0, "ns"),
+			"isobaricInhPa": float(level),
+			"latitude": lats,
+			"longitude": lons,
+			"valid_time": time
+		}
+	)
+
+######################################################################
+
+def flight_kml(points=500, orig="sydney", dest="santiago", date="2024-06-18", name="SYN001", speed=250):
+
+	# A flight along the geodesic from orig to dest, with "points" positions
+	# in the Route folder and a segment between each pair in the Trail
+	# folder. It starts and finishes on the ground and cruises in between
+	(lat1, lon1) = route_distance.parse_location(orig)
+	(lat2, lon2) = route_distance.parse_location(dest)
+
+	(lats, lons) = route_distance.globe_track(lat1, lon1, lat2, lon2, max(points - 1, 1))
+	(az12, az21, dist) = route_distance.get_geod().inv(lon1, lat1, lon2, lat2)
+
+	altitudes = np.full(len(lats), 11000.0)
+	altitudes[0] = altitudes[-1] = 0
+
+	# Normalise the longitudes the way FR24 does
+	lons = np.where(lons > 180, lons - 360, lons)
+
+	takeoff = datetime.datetime.fromisoformat(date).replace(hour=1, tzinfo=datetime.timezone.utc)
+	step = dist / speed / max(len(lats) - 1, 1)
+
+	route = []
+	trail = []
+
+	for idx in range(len(lats)):
+		when = (takeoff + datetime.timedelta(seconds=round(idx * step))).isoformat().replace("+00:00", "Z")
+		coords = f"{lons[idx]:.6f},{lats[idx]:.6f},{altitudes[idx]:.0f}"
+
+		route.append(f"""
+			<Placemark>
+				<name>{idx}</name>
+				<TimeStamp><when>{when}</when></TimeStamp>
+				<Point><coordinates>{coords}</coordinates></Point>
+			</Placemark>""")
+
+		if (idx > 0):
+			trail.append(f"""
+			<Placemark>
+				<MultiGeometry>
+					<LineString><coordinates>{previous} {coords}</coordinates></LineString>
+				</MultiGeometry>
+			</Placemark>""")
+
+		previous = coords
+
+	return f"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+	<Document>
+		<name>{name}</name>
+		<Folder>
+			<name>Route</name>{"".join(route)}
+		</Folder>
+		<Folder>
+			<name>Trail</name>{"".join(trail)}
+		</Folder>
+	</Document>
+</kml>
+"""
+
+######################################################################
+
+def main():
+
+	# Command line arguments
+	parser = argparse.ArgumentParser(
+				prog='Synthetic data',
+				description='Writes a synthetic FlightRadar24 KML file')
+
+	parser.add_argument('-o', '--orig', default="sydney", help="Airport name or lat,lon")
+	parser.add_argument('-d', '--dest', default="santiago", help="Airport name or lat,lon")
+	parser.add_argument('--date', default="2024-06-18", help="YYYY-MM-DD")
+	parser.add_argument('--points', type=int, default=500, help="Number of positions along the route")
+	parser.add_argument("--out") # Write to a named KML file
+
+	args = parser.parse_args()
+
+	kml = flight_kml(args.points, args.orig, args.dest, args.date)
+
+	if (args.out):
+		with open(args.out, "w") as fp:
+			fp.write(kml)
+	else:
+		sys.stdout.write(kml)
+
+######################################################################
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,331 @@
+# Wind-optimal route
+#  Finds the quickest path between two points through the GFS wind field,
+# using the same airspeed + head/tail wind model as analyse_flight.py, and
+# compares it to flying the geodesic.
+#
+# Every grid cell is a node, joined to its 16 nearest neighbours. The time to
+# fly each edge is worked out for the whole grid at once with numpy, and then
+# A* finds the minimum-time path.
+import argparse
+import datetime
+import heapq
+import math
+import sys
+import numpy as np
+import grib_downloader # type: ignore
+import route_distance # type: ignore
+
+# Neighbouring cells (lat, lon) that each node connects to. The knight's
+# moves give 16 headings instead of 8, so paths don't zig-zag so much
+NEIGHBOURS = [
+	(-1, 0), (1, 0), (0, -1), (0, 1),
+	(-1, -1), (-1, 1), (1, -1), (1, 1),
+	(-1, -2), (-1, 2), (1, -2), (1, 2),
+	(-2, -1), (-2, 1), (2, -1), (2, 1)
+]
+
+######################################################################
+
+def wind_grid(ds):
+
+	# Pulls the u/v grids out of a dataset. Assumes a regular lat/lon grid,
+	# which is what NOMADS gives us
+	return {
+		"latitude": ds.latitude.values.astype(np.float64),
+		"longitude": ds.longitude.values.astype(np.float64),
+		"u": ds.u.values.astype(np.float64),
+		"v": ds.v.values.astype(np.float64)
+	}
+
+######################################################################
+
+def calculate_azimuths(u_vals, v_vals):
+
+	# The y value is actually increasing from SOUTH to NORTH
+	azi = 90 - np.trunc(np.arctan2(v_vals, u_vals) * 180 / math.pi)
+
+	return np.where(azi < 0, azi + 360, azi)
+
+######################################################################
+
+def nearest_indices(wind, lats, lons):
+
+	# Grid indices of the closest wind sample to each lat/lon
+	lat0, lon0 = wind["latitude"][0], wind["longitude"][0]
+	dlat = wind["latitude"][1] - lat0
+	dlon = wind["longitude"][1] - lon0
+
+	nlat = len(wind["latitude"])
+	nlon = len(wind["longitude"])
+
+	lat_idx = np.clip(np.rint((np.asarray(lats) - lat0) / dlat).astype(int), 0, nlat - 1)
+	lon_idx = np.rint((np.asarray(lons) - lon0) / dlon).astype(int) % nlon
+
+	return lat_idx, lon_idx
+
+######################################################################
+
+def ground_speeds(u_vals, v_vals, az12, speed):
+
+	# Same model as analyse_flight.parse_trail: the plane flies at "speed"
+	# through the air, plus whatever part of the wind is along its heading
+	magnitude = np.sqrt(u_vals**2 + v_vals**2)
+	azimuth = calculate_azimuths(u_vals, v_vals)
+
+	head_tail = np.cos(np.radians(azimuth - az12)) * magnitude
+
+	return speed + head_tail
+
+######################################################################
+
+def route_time(wind, lats, lons, speed):
+
+	# Seconds to fly along a path, using the wind at the start of each segment
+	lats = np.asarray(lats)
+	lons = np.asarray(lons)
+
+	(az12, az21, dist) = route_distance.get_geod().inv(lons[:-1], lats[:-1], lons[1:], lats[1:])
+
+	lat_idx, lon_idx = nearest_indices(wind, lats[:-1], lons[:-1])
+	gs = ground_speeds(wind["u"][lat_idx, lon_idx], wind["v"][lat_idx, lon_idx], np.asarray(az12), speed)
+
+	return float(np.sum(np.asarray(dist) / gs))
+
+######################################################################
+
+def edge_costs(wind, speed):
+
+	# Time (seconds) to fly from every node to each of its NEIGHBOURS, as a
+	# (nodes, neighbours) array, plus the index of each neighbour
+	lats = wind["latitude"]
+	lons = wind["longitude"]
+	nlat, nlon = wind["u"].shape
+
+	lat_idx, lon_idx = np.meshgrid(np.arange(nlat), np.arange(nlon), indexing="ij")
+	lat_idx = lat_idx.ravel()
+	lon_idx = lon_idx.ravel()
+
+	costs = np.empty((nlat * nlon, len(NEIGHBOURS)))
+	nbrs = np.empty((nlat * nlon, len(NEIGHBOURS)), dtype=np.int64)
+
+	u_vals = wind["u"].ravel()
+	v_vals = wind["v"].ravel()
+
+	for k, (dlat, dlon) in enumerate(NEIGHBOURS):
+		to_lat = lat_idx + dlat
+		to_lon = (lon_idx + dlon) % nlon
+
+		# Don't fall off the top or bottom of the grid
+		valid = (to_lat >= 0) & (to_lat < nlat)
+		to_lat = np.clip(to_lat, 0, nlat - 1)
+
+		(az12, az21, dist) = route_distance.get_geod().inv(lons[lon_idx], lats[lat_idx], lons[to_lon], lats[to_lat])
+
+		gs = ground_speeds(u_vals, v_vals, np.asarray(az12), speed)
+
+		# A headwind stronger than the plane's airspeed means you can't go that way
+		with np.errstate(divide="ignore"):
+			costs[:, k] = np.where(valid & (gs > 0), np.asarray(dist) / gs, np.inf)
+
+		nbrs[:, k] = to_lat * nlon + to_lon
+
+	return costs, nbrs
+
+######################################################################
+
+def optimal_route(wind, lat1, lon1, lat2, lon2, speed):
+
+	# A* from the grid node nearest the origin to the node nearest the
+	# destination. Returns the path as lat/lon arrays (including the actual
+	# origin and destination)
+	nlat, nlon = wind["u"].shape
+	lats = wind["latitude"]
+	lons = wind["longitude"]
+
+	costs, nbrs = edge_costs(wind, speed)
+
+	(start_lat, start_lon) = nearest_indices(wind, lat1, lon1)
+	(goal_lat, goal_lon) = nearest_indices(wind, lat2, lon2)
+	start = int(start_lat) * nlon + int(start_lon)
+	goal = int(goal_lat) * nlon + int(goal_lon)
+
+	# Heuristic: straight to the goal with the best tailwind anywhere on the
+	# grid. It never overestimates, so A* still finds the quickest path
+	node_lats, node_lons = np.meshgrid(lats, lons, indexing="ij")
+	(az12, az21, dist) = route_distance.get_geod().inv(node_lons.ravel(), node_lats.ravel(),
+		np.full(nlat * nlon, lons[goal_lon]), np.full(nlat * nlon, lats[goal_lat]))
+	max_speed = speed + float(np.max(np.sqrt(wind["u"]**2 + wind["v"]**2)))
+	heuristic = (np.asarray(dist) / max_speed).tolist()
+
+	# Plain lists are much quicker than numpy for one element at a time
+	costs = costs.tolist()
+	nbrs = nbrs.tolist()
+
+	best = [math.inf] * (nlat * nlon)
+	prev = [-1] * (nlat * nlon)
+	best[start] = 0
+
+	heap = [(heuristic[start], 0, start)]
+
+	while (heap):
+		(f, t, node) = heapq.heappop(heap)
+
+		if (node == goal):
+			break
+
+		# Already found a quicker way here
+		if (t > best[node]):
+			continue
+
+		for (cost, nbr) in zip(costs[node], nbrs[node]):
+			new_t = t + cost
+
+			if (new_t < best[nbr]):
+				best[nbr] = new_t
+				prev[nbr] = node
+				heapq.heappush(heap, (new_t + heuristic[nbr], new_t, nbr))
+
+	# Every way there is blocked by a headwind stronger than the plane
+	if (best[goal] == math.inf):
+		raise ValueError(f"can't reach the destination at {speed} m/s through this wind")
+
+	# Walk back from the goal
+	path = [goal]
+	while (path[-1] != start):
+		path.append(prev[path[-1]])
+
+	path.reverse()
+
+	path_lats = [lat1] + [float(lats[node // nlon]) for node in path] + [lat2]
+	path_lons = [lon1] + [float(lons[node % nlon]) for node in path] + [lon2]
+
+	return np.array(path_lats), np.array(path_lons)
+
+######################################################################
+
+def kml_header(name):
+
+	return f"""<?xml version="1.0" encoding="UTF-8"?>
+	<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2" xmlns:kml="http://www.opengis.net/kml/2.2" xmlns:atom="http://www.w3.org/2005/Atom">
+	<Document>
+		<name>{name}</name>
+		<open>1</open>
+		<Style id="s_optimal">
+			<LineStyle>
+				<color>FF3FFF3F</color>
+				<width>3</width>
+			</LineStyle>
+		</Style>
+		<Style id="s_geodesic">
+			<LineStyle>
+				<color>FFFFFFFF</color>
+				<width>2</width>
+			</LineStyle>
+		</Style>"""
+
+######################################################################
+
+def create_path(lats, lons, name, style):
+
+	# Normalise the longitude for Google Earth
+	coords = [f"{(lon - 360 if lon > 180 else lon):.6f},{lat:.6f},0" for (lat, lon) in zip(lats, lons)]
+
+	return f"""
+	<Placemark>
+	   	<name>{name}</name>
+		<styleUrl>#{style}</styleUrl>
+		<LineString>
+			<tessellate>1</tessellate>
+			<coordinates>
+				{" ".join(coords)}
+			</coordinates>
+		</LineString>
+	</Placemark>"""
+
+######################################################################
+
+def kml_footer():
+
+	return f"""
+		</Document>
+	</kml>
+	"""
+
+######################################################################
+
+def format_time(seconds):
+
+	# timedelta prints negative durations as "-1 day, 23:..."
+	sign = "-" if seconds < 0 else ""
+
+	return sign + str(datetime.timedelta(seconds=round(abs(seconds), 0)))
+
+######################################################################
+
+def airspeed(text):
+
+	# argparse type for --speed: the search can't go anywhere at zero
+	speed = float(text)
+
+	if (speed <= 0):
+		raise argparse.ArgumentTypeError("must be more than 0")
+
+	return speed
+
+######################################################################
+
+def main():
+
+	# Command line arguments
+	parser = argparse.ArgumentParser(
+				prog='Wind-optimal route',
+				description='Finds the quickest route between two points through the wind')
+
+	parser.add_argument('-o', '--orig', required=True, help="Airport name or lat,lon. e.g. -o-30,100")
+	parser.add_argument('-d', '--dest', required=True, help="Airport name or lat,lon. e.g. -d-30,100")
+	parser.add_argument('--date', required=True, help="YYYY-MM-DD") # Date of the GRIB file
+	parser.add_argument("--level", type=int, choices=[300, 250, 200, 150, 100, 50], default=250, help="hPa")
+	parser.add_argument("-s", "--speed", type=airspeed, help="metres per second", default=250) # speed in m/s (250 m/s = 900 km/h = 559 mph)
+	parser.add_argument("--out") # Write to a named KML file
+
+	args = parser.parse_args()
+
+	(lat1, lon1) = route_distance.parse_location(args.orig)
+	(lat2, lon2) = route_distance.parse_location(args.dest)
+
+	wind = wind_grid(grib_downloader.get_dataset(args.date, args.level))
+
+	try:
+		(path_lats, path_lons) = optimal_route(wind, lat1, lon1, lat2, lon2, args.speed)
+	except ValueError as e:
+		print(e, file=sys.stderr)
+		sys.exit(1)
+	optimal_time = route_time(wind, path_lats, path_lons, args.speed)
+
+	# Fly the geodesic in roughly 1° steps for comparison
+	(az12, az21, dist) = route_distance.get_geod().inv(lon1, lat1, lon2, lat2)
+	(geo_lats, geo_lons) = route_distance.globe_track(lat1, lon1, lat2, lon2, max(math.ceil(dist / 100000), 1))
+	geodesic_time = route_time(wind, geo_lats, geo_lons, args.speed)
+
+	print(f"Optimal: {format_time(optimal_time)}", file=sys.stderr)
+	print(f"Geodesic: {format_time(geodesic_time)}", file=sys.stderr)
+	print(f"Saving: {format_time(geodesic_time - optimal_time)}", file=sys.stderr)
+
+	# Output file
+	if (args.out):
+		fp = open(args.out, "w")
+	else:
+		fp = sys.stdout
+
+	print(kml_header(f"{args.orig} - {args.dest} - {args.date} ({args.level} hPa)"), file=fp)
+	print(create_path(path_lats, path_lons, f"Optimal: {format_time(optimal_time)}", "s_optimal"), file=fp)
+	print(create_path(geo_lats, geo_lons, f"Geodesic: {format_time(geodesic_time)}", "s_geodesic"), file=fp)
+	print(kml_footer(), file=fp)
+
+	if (args.out):
+		fp.close()
+
+######################################################################
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,188 @@
+# Wind tile server
+#  Serves the grib_to_placemarks NetworkLinks on demand over HTTP, so Google
+# Earth only asks for (and we only render) the regions that are on screen.
+#
+# Point a Google Earth NetworkLink at:
+#
+#   http://127.0.0.1:8000/YYYY-MM-DD/250/doc.kml
+#
+# doc.kml lists one NetworkLink per region (see grib_to_placemarks.links), and
+# each of those fetches linkNN.kml from the same directory.
+import argparse
+import functools
+import http.server
+import os
+import re
+import sys
+import threading
+import urllib.parse
+import grib_downloader # type: ignore
+import grib_to_placemarks # type: ignore
+
+# How many decoded GRIB files and rendered tiles to keep hold of
+DATASET_CACHE_SIZE = 8
+TILE_CACHE_SIZE = 256
+
+LEVELS = [300, 250, 200, 150, 100, 50]
+UNITS = ['mph', 'kmh', 'mps']
+REFRESH_MODES = ['onRegion', 'onStop']
+
+# The icon that the placemark styles refer to
+ARROW_FILE = "files/windarrow.png"
+
+# /YYYY-MM-DD/level/doc.kml, /YYYY-MM-DD/level/linkNN.kml or /YYYY-MM-DD/level/windarrow.png
+path_re = re.compile(r"^/(\d{4}-\d{2}-\d{2})/(\d+)/(doc\.kml|link(\d{2})\.kml|windarrow\.png)$")
+
+# (date, level) -> lock. Downloading and decoding the same GRIB file from
+# several threads at once is wasteful, so each file has its own lock, and a
+# slow download only holds up the requests that need that file
+dataset_locks = {}
+
+######################################################################
+
+@functools.lru_cache(maxsize=DATASET_CACHE_SIZE)
+def load_wind(date, level):
+
+	ds = grib_downloader.get_dataset(date, level)
+	return grib_to_placemarks.wind_arrays(ds)
+
+######################################################################
+
+def get_wind(date, level):
+
+	# Google Earth asks for all the tiles of a new date at once. The cache is
+	# checked under the file's lock, so the first request decodes the file and
+	# the rest wait for it and then find it in the cache. setdefault() is
+	# atomic, so two threads can't end up with different locks
+	with dataset_locks.setdefault((date, level), threading.Lock()):
+		return load_wind(date, level)
+
+######################################################################
+
+@functools.lru_cache(maxsize=TILE_CACHE_SIZE)
+def render_tile(date, level, idx, units):
+
+	wind = get_wind(date, level)
+	placemarks = grib_to_placemarks.render_link(wind, grib_to_placemarks.links[idx], units)
+
+	return "\n".join([grib_to_placemarks.kml_header(str(idx))] + placemarks + [grib_to_placemarks.kml_footer()])
+
+######################################################################
+
+def render_doc(date, level, units, refresh_mode):
+
+	# The master file doesn't need the wind data at all, Google Earth will
+	# come back for each region as it comes into view
+	doc = [grib_to_placemarks.kml_header(f"Wind: {date} ({level} hPa)")]
+
+	for idx in range(len(grib_to_placemarks.links)):
+		href = f"{grib_to_placemarks.link_filename(idx)}?units={units}"
+		doc.append(grib_to_placemarks.network_link(idx, grib_to_placemarks.links[idx], href, refresh_mode))
+
+	doc.append(grib_to_placemarks.kml_footer())
+
+	return "\n".join(doc)
+
+######################################################################
+
+class TileHandler(http.server.BaseHTTPRequestHandler):
+
+	def send_body(self, body, content_type):
+
+		self.send_response(200)
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+
+		url = urllib.parse.urlsplit(self.path)
+		query = urllib.parse.parse_qs(url.query)
+
+		match = path_re.match(url.path)
+		if (not match):
+			self.send_error(404)
+			return
+
+		(date, level, filename, link_idx) = match.groups()
+		level = int(level)
+
+		units = query.get("units", [self.server.units])[0]
+		refresh_mode = query.get("refresh", [self.server.refresh_mode])[0]
+
+		if (level not in LEVELS or units not in UNITS or refresh_mode not in REFRESH_MODES):
+			self.send_error(400)
+			return
+
+		if (filename == "windarrow.png"):
+			if (not os.path.isfile(ARROW_FILE)):
+				self.send_error(404)
+				return
+
+			with open(ARROW_FILE, "rb") as fp:
+				self.send_body(fp.read(), "image/png")
+
+		elif (filename == "doc.kml"):
+			body = render_doc(date, level, units, refresh_mode)
+			self.send_body(body.encode("utf-8"), "application/vnd.google-earth.kml+xml")
+
+		else:
+			idx = int(link_idx)
+			if (idx >= len(grib_to_placemarks.links)):
+				self.send_error(404)
+				return
+
+			try:
+				body = render_tile(date, level, idx, units)
+			except SystemExit:
+				# grib_downloader quits when a download fails, which it will
+				# for any date NOMADS no longer has
+				self.send_error(502, f"No GRIB data for {date} at {level} hPa")
+				return
+
+			self.send_body(body.encode("utf-8"), "application/vnd.google-earth.kml+xml")
+
+######################################################################
+
+def make_server(host="127.0.0.1", port=8000, units="mps", refresh_mode="onRegion"):
+
+	# Each request gets its own thread, so Google Earth can fetch several
+	# regions at once
+	server = http.server.ThreadingHTTPServer((host, port), TileHandler)
+	server.daemon_threads = True
+	server.units = units
+	server.refresh_mode = refresh_mode
+
+	return server
+
+######################################################################
+
+def main():
+
+	# Command line arguments
+	parser = argparse.ArgumentParser(
+				prog='Wind tile server',
+				description='Serves GRIB wind placemarks to Google Earth on demand')
+
+	parser.add_argument('--host', default="127.0.0.1")
+	parser.add_argument('--port', type=int, default=8000)
+	parser.add_argument("--units", choices=UNITS, default='mps')
+	parser.add_argument("--refresh", choices=REFRESH_MODES, default='onRegion', help="viewRefreshMode for each NetworkLink")
+
+	args = parser.parse_args()
+
+	server = make_server(args.host, args.port, args.units, args.refresh)
+	print(f"Serving on http://{args.host}:{server.server_address[1]}/YYYY-MM-DD/level/doc.kml", file=sys.stderr)
+
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+	server.server_close()
+
+######################################################################
+
+if __name__ == "__main__":
+	main()